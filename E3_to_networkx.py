@@ -1,12 +1,14 @@
-import networkx as nx
 import pandas as pd
 import gzip
 import gdown
 import json
+import multiprocessing
 import os
 import pickle
 import re
-from node import Node
+import sys
+import compact_graph
+import graph_builder
 
 def Parse(path,uid_type,uid_label):
 
@@ -127,26 +129,19 @@ def extract_info(audit_logs):
     return uid_type, uid_label
 
 def generate_networkx_graph_from_paths(paths):
-    df = pd.DataFrame()
+    dfs = []
     for path in paths:
         events = load_data(path)
 
         types,labels = extract_info(events)
 
-        new_df = Parse(path,types,labels)
-        df = pd.concat([df, new_df], ignore_index=True)
+        dfs.append(Parse(path,types,labels))
+    df = pd.concat(dfs, ignore_index=True)
     
     df = df[['subjectname','subject_type','objectname','object_type','syscall','timestamp']]
 
-    G = nx.DiGraph()
+    G = graph_builder.build_graph(df)
 
-    for _, row in df.iterrows():
-        node1 = Node(row['subjectname'], row['subject_type'], row['subjectname'])
-        G.add_node(node1.id, node=node1)
-        node2 = Node(row['objectname'], row['object_type'], row['objectname'])
-        G.add_node(node2.id, node=node2)
-        G.add_edge(node1.id, node2.id)
-    
     return G, df
 
 def generate_networkx_graph(path):
@@ -157,24 +152,285 @@ def generate_networkx_graph(path):
 
     df = Parse(path,types,labels)
 
-    edges = df[['subjectname', 'objectname']].values.tolist()
-
     df = df[['subjectname','subject_type','objectname','object_type','syscall','timestamp']]
 
-    G = nx.DiGraph()
+    G = graph_builder.build_graph(df)
 
-    for _, row in df.iterrows():
-        node1 = Node(row['subjectname'], row['subject_type'], row['subjectname'])
-        G.add_node(node1.id, node=node1)
-        node2 = Node(row['objectname'], row['object_type'], row['objectname'])
-        G.add_node(node2.id, node=node2)
-        G.add_edge(node1.id, node2.id)
-    
     return G, df
 
+CDM = "com.bbn.tc.schema.avro.cdm18."
+
+def uuid_key(uuid):
+    """
+    Compact key for a CDM UUID: its 16 raw bytes instead of the 36 character string.
+    """
+    try:
+        return bytes.fromhex(uuid.replace("-", ""))
+    except ValueError:
+        return uuid
+
+def string_value(value):
+    # CDM optional strings are either plain strings or {"string": ...} unions
+    if isinstance(value, dict):
+        return value.get("string")
+    return value
+
+class StreamParser:
+    """
+    Single-pass parser of E3 CDM records.
+
+    Every line is decoded with json.loads at most once. Subjects, registry keys
+    and netflows go into a compact UUID table (UUID bytes -> (type, label)), and
+    events are resolved against it right away into edge records
+    (subjectname, subject_type, objectname, object_type, syscall, timestamp),
+    following the same rules as Parse. Events that reference a UUID not seen
+    yet are kept in pending and resolved by resolve_pending once the table is
+    complete, so memory grows with the number of unique entities rather than
+    with the number of events.
+    """
+    def __init__(self):
+        self.uuid_table = {}
+        self.pending = []
+
+    def parse_line(self, line):
+        """
+        Args:
+            line (str): one JSON line of the CDM file.
+
+        Returns:
+            list: the edge records of the line (empty for entities, unresolved events and other records).
+        """
+        if CDM + "Event" in line:
+            return self.parse_event_line(line)
+        self.parse_entity_line(line)
+        return []
+
+    def parse_event_line(self, line):
+        """
+        Returns:
+            list: the edge records of an event line, empty if the event was left pending.
+        """
+        event = json.loads(line)["datum"][CDM + "Event"]
+        fields = self.event_fields(event)
+        if self.is_resolvable(fields):
+            return event_records(fields, self.uuid_table)
+        self.pending.append(fields)
+        return []
+
+    def parse_entity_line(self, line):
+        # adds the subject, registry key or netflow defined by a non-event line
+        if CDM + "Subject" in line or CDM + "RegistryKeyObject" in line or CDM + "NetFlowObject" in line:
+            self.add_entity(json.loads(line)["datum"])
+
+    def add_entity(self, datum):
+        for record_type, entity in datum.items():
+            record_type = record_type[len(CDM):]
+            label = None
+            if record_type == "Subject":
+                entity_type = entity.get("type")
+                label = string_value(entity.get("cmdLine"))
+            elif record_type == "RegistryKeyObject":
+                entity_type = "RegistryKeyObject"
+                label = string_value(entity.get("key"))
+            elif record_type == "NetFlowObject":
+                entity_type = "NetFlowObject"
+                label = string_value(entity.get("remoteAddress"))
+            if label:
+                self.uuid_table[uuid_key(entity["uuid"])] = (sys.intern(entity_type), label)
+
+    def event_fields(self, event):
+        def uuid_of(field):
+            value = event.get(field)
+            if isinstance(value, dict) and CDM + "UUID" in value:
+                return uuid_key(value[CDM + "UUID"])
+            return None
+
+        properties = event.get("properties") or {}
+        cmd = (properties.get("map") or {}).get("exec") or ""
+        return (event.get("type", ""), uuid_of("subject"), uuid_of("predicateObject"), uuid_of("predicateObject2"),
+                string_value(event.get("predicateObjectPath")) or "", string_value(event.get("predicateObject2Path")) or "",
+                cmd, event.get("timestampNanos"))
+
+    def is_resolvable(self, fields):
+        _, actor, obj, obj2, path, path2, cmd, _ = fields
+        return ((cmd or actor is None or actor in self.uuid_table)
+                and (path or obj is None or obj in self.uuid_table)
+                and (path2 or obj2 is None or obj2 in self.uuid_table))
+
+    def resolve_pending(self, uuid_table=None):
+        """
+        Resolves the pending events against uuid_table (defaults to this
+        parser's table); references that are still unknown are dropped, as in Parse.
+
+        Returns:
+            list: the edge records of the pending events.
+        """
+        uuid_table = self.uuid_table if uuid_table is None else uuid_table
+        records = [record for fields in self.pending for record in event_records(fields, uuid_table)]
+        self.pending = []
+        return records
+
+def event_records(fields, uuid_table):
+    action, actor, obj, obj2, path, path2, cmd, timestamp = fields
+    subject = uuid_table.get(actor) if actor is not None else None
+    subjtype, subjname = subject if subject else (None, None)
+    obj_entity = uuid_table.get(obj) if obj is not None else None
+    objtype, objname = obj_entity if obj_entity else (None, None)
+    obj2_entity = uuid_table.get(obj2) if obj2 is not None else None
+    objtype2, objname2 = obj2_entity if obj2_entity else (None, None)
+
+    if path != '':
+        objname = path
+        objtype = "FileObject"
+    if path2 != '':
+        objname2 = path2
+        objtype2 = "FileObject"
+    if cmd != '':
+        subjname = cmd
+        subjtype = "SUBJECT_PROCESS"
+
+    records = []
+    if subjname and subjtype and objname and objtype:
+        records.append((subjname, subjtype, objname, objtype, action, timestamp))
+    if subjname and subjtype and objname2 and objtype2:
+        records.append((subjname, subjtype, objname2, objtype2, action, timestamp))
+    return records
+
+# number of records buffered before they are added to a GraphBuilder
+RECORD_BATCH = 100000
+
+def generate_streaming_networkx_graph(path):
+    """
+    Builds the graph of an E3 CDM file in a single streaming pass, without
+    loading the file or a DataFrame of all events into memory.
+
+    Args:
+        path (str): The path to the CDM JSON file.
+
+    Returns:
+        G (networkx.DiGraph): The provenance graph.
+    """
+    builder = graph_builder.GraphBuilder()
+    parser = StreamParser()
+    records = []
+    with open(path) as f:
+        for line in f:
+            records.extend(parser.parse_line(line))
+            if len(records) >= RECORD_BATCH:
+                builder.add_records(records)
+                records = []
+    records.extend(parser.resolve_pending())
+    builder.add_records(records)
+    return builder.graph()
+
+# byte size of the shards large CDM files are split into for parallel ingestion
+SHARD_SIZE = 256 * 1024 * 1024
+
+def split_shards(paths, shard_size=SHARD_SIZE):
+    """
+    Splits files into (path, start, end) byte ranges of about shard_size bytes.
+    """
+    shards = []
+    for path in paths:
+        size = os.path.getsize(path)
+        for start in range(0, max(size, 1), shard_size):
+            shards.append((path, start, min(start + shard_size, size)))
+    return shards
+
+def shard_lines(shard):
+    """
+    Yields the lines starting inside one byte range of a CDM file.
+
+    Args:
+        shard (tuple): (path, start, end) as returned by split_shards.
+    """
+    path, start, end = shard
+    with open(path, "rb") as f:
+        if start > 0:
+            # skip the line that started before this shard
+            f.seek(start - 1)
+            f.readline()
+        while f.tell() < end:
+            line = f.readline()
+            if not line:
+                break
+            yield line.decode("utf-8")
+
+def parse_shard_entities(shard):
+    """
+    First ingestion phase: collects the entities defined in one shard, events are skipped without being decoded.
+
+    Returns:
+        dict: the shard's UUID table.
+    """
+    parser = StreamParser()
+    for line in shard_lines(shard):
+        if CDM + "Event" not in line:
+            parser.parse_entity_line(line)
+    return parser.uuid_table
+
+# merged UUID table of all shards, set in each worker of the second phase
+_uuid_table = None
+
+def set_uuid_table(uuid_table):
+    global _uuid_table
+    _uuid_table = uuid_table
+
+def parse_shard_events(shard):
+    """
+    Second ingestion phase: resolves the events of one shard against the
+    merged UUID table; references that are unknown in every shard are dropped,
+    as in Parse.
+
+    Returns:
+        graph_builder.GraphBuilder: the shard's partial edge table.
+    """
+    parser = StreamParser()
+    builder = graph_builder.GraphBuilder()
+    records = []
+    for line in shard_lines(shard):
+        if CDM + "Event" in line:
+            event = json.loads(line)["datum"][CDM + "Event"]
+            records.extend(event_records(parser.event_fields(event), _uuid_table))
+            if len(records) >= RECORD_BATCH:
+                builder.add_records(records)
+                records = []
+    builder.add_records(records)
+    return builder
+
+def generate_parallel_networkx_graph(paths, workers=None, shard_size=SHARD_SIZE):
+    """
+    Builds one graph from several CDM files (e.g. ta1-cadets-e3-official.json,
+    .json.1, .json.2) by parsing byte-range shards in a process pool, in two phases:
+    the workers first collect the entities of their shards and the UUID tables
+    are merged, then every worker resolves the events of its shards against the
+    merged table into a partial edge table. References across shards and files
+    are kept, and no event is ever sent back to the parent.
+
+    Args:
+        paths (list): The CDM JSON files.
+        workers (int): Number of worker processes (defaults to the number of CPUs).
+        shard_size (int): Approximate shard size in bytes.
+
+    Returns:
+        G (networkx.DiGraph): The provenance graph.
+    """
+    shards = split_shards(paths, shard_size)
+    uuid_table = {}
+    with multiprocessing.Pool(workers) as pool:
+        for shard_uuid_table in pool.map(parse_shard_entities, shards):
+            uuid_table.update(shard_uuid_table)
+
+    builder = graph_builder.GraphBuilder()
+    with multiprocessing.Pool(workers, initializer=set_uuid_table, initargs=(uuid_table,)) as pool:
+        for shard_builder in pool.imap(parse_shard_events, shards):
+            builder.update(shard_builder)
+    return builder.graph()
+
 def save_graph_to_disk(graph, filepath):
     """
-    Save the NetworkX graph to disk in GPickle format.
+    Save the NetworkX graph to disk in GPickle format, or as a memory-mappable
+    .pgraph directory when filepath ends in ".pgraph".
 
     Args:
         graph (networkx.Graph): The NetworkX graph to be saved.
@@ -183,6 +439,11 @@ def save_graph_to_disk(graph, filepath):
     Returns:
         None
     """
+    if filepath.rstrip("/").endswith(".pgraph"):
+        if not isinstance(graph, compact_graph.CompactGraph):
+            graph = compact_graph.from_networkx(graph)
+        compact_graph.save(graph, filepath.rstrip("/"))
+        return
     with open(filepath, "wb") as f:
             pickle.dump(graph, f)
 
@@ -194,18 +455,23 @@ def load_graph_from_disk(filepath):
         filepath (str): The path to the graph file.
 
     Returns:
-        G (networkx.Graph): The loaded NetworkX graph.
+        G (networkx.Graph): The loaded NetworkX graph (a memory-mapped
+        CompactGraph for a ".pgraph" directory).
     """
+    if filepath.rstrip("/").endswith(".pgraph"):
+        return compact_graph.load(filepath.rstrip("/"))
     with open(filepath, "rb") as f:
         graph = pickle.load(f)
     return graph
 
 def main():
     # paths = ["cadets/ta1-cadets-e3-official.json", "cadets/ta1-cadets-e3-official.json.1", "cadets/ta1-cadets-e3-official.json.2"]
+    # G = generate_parallel_networkx_graph(paths)
     path = "cadets/ta1-cadets-e3-official.json"
     # Constructing Graph
-    G, df = generate_networkx_graph(path)
-    df.to_pickle("E3_df.pkl")
+    # G, df = generate_networkx_graph(path)
+    # df.to_pickle("E3_df.pkl")
+    G = generate_streaming_networkx_graph(path)
     save_graph_to_disk(G, "e3_networkx_graph.pkl")
 
 if __name__ == "__main__":
@@ -0,0 +1,88 @@
+# Runs a library of query graphs against one provenance graph.
+# The provenance graph is loaded once and everything derived from it is shared
+# by all queries: the node and process-ancestor indexes and the influence score
+# cache live in graph_indexes, and step 1 candidate lists are looked up once per
+# distinct (type, label) of a query node, so queries that share nodes (e.g. the
+# same dropped file or C2 address) reuse each other's work. Like main.py, step 4
+# of each query runs on the provenance graph pruned for that query; pruned
+# networkx graphs share the influence score cache of the whole graph.
+#
+# usage: python batch.py <provenance graph file> <threshold> <query graph file> [<query graph file> ...]
+#        [--scoring-workers=<n>] [--time-window=<start>,<end>] [--time-respecting]
+
+import sys
+import time
+import influence_cache
+import loaders
+import main
+import poirot
+import pruning
+
+def shared_candidate_alignments(query_graph, provenance_graph, lookups, comparison_function=main.compare):
+    '''
+    step 1 with candidate lists shared between queries
+    params: lookups -> dict {(type, label): candidates} filled across queries
+    returns: as poirot.find_candidate_node_alignments_with_custom_comparison
+    '''
+    candidate_alignments = {}
+    for query_node_id in query_graph.nodes:
+        query_node = query_graph.nodes[query_node_id]['node']
+        key = (query_node.type, query_node.label)
+        if key not in lookups:
+            lookups[key] = poirot.find_candidates(query_node, provenance_graph, comparison_function)
+        if len(lookups[key]) > 0:
+            candidate_alignments[query_node_id] = lookups[key]
+    return candidate_alignments
+
+def run_batch(provenance_graph, query_files, threshold, scoring_workers=1, time_window=None, time_respecting=False):
+    '''
+    params: provenance_graph -> the loaded provenance graph
+            query_files -> query graph files, in any format loaders.load_graph accepts
+            threshold -> upper bound for number of distinct compromises attacker can reasonably exploit
+            scoring_workers -> number of processes scoring candidates in step 4
+            time_window, time_respecting -> optional temporal constraint, as in main.detect
+    returns: one dict per query with its alert, alignment, score, per-step
+            timings and the influence cache hits and misses it caused
+    '''
+    lookups = {}
+    results = []
+    for query_file in query_files:
+        print(f"Running query {query_file}...")
+        query_graph = loaders.load_graph(query_file)
+        start_time = time.time()
+        candidate_alignments = shared_candidate_alignments(query_graph, provenance_graph, lookups)
+        timings = {"candidates": time.time() - start_time}
+        pruned_graph, position, _ = pruning.prune(provenance_graph, query_graph, candidate_alignments)
+        timings["prune"] = time.time() - start_time - timings["candidates"]
+        # the cache of the whole graph unless the pruned graph is compact
+        cache = influence_cache.get_influence_cache(pruned_graph)
+        hits, misses = cache.hits, cache.misses
+        alerted, alignment, score = main.detect(provenance_graph, query_graph, threshold, candidate_alignments, timings,
+                                                scoring_workers, pruned=(pruned_graph, position),
+                                                time_window=time_window, time_respecting=time_respecting)
+        timings["total"] = time.time() - start_time
+        results.append({"query": query_file, "alert": alerted, "score": score, "alignment": alignment,
+                        "timings": timings, "cache_hits": cache.hits - hits, "cache_misses": cache.misses - misses})
+    return results
+
+def run():
+    print("Initiating batch POIROT algorithm...")
+    args, options = main.parse_options(sys.argv[1:])
+    if len(args) < 3:
+        print("python batch.py <provenance graph file> <threshold> <query graph file> [<query graph file> ...] [--scoring-workers=<n>] "
+              "[--time-window=<start>,<end>] [--time-respecting]")
+        exit(1)
+    start_time = time.time()
+    provenance_graph = loaders.load_graph(args[0])
+    load_time = time.time() - start_time
+    threshold = int(args[1])
+    results = run_batch(provenance_graph, args[2:], threshold, options["scoring_workers"],
+                        options["time_window"], options["time_respecting"])
+
+    print(f"Provenance graph loaded in {load_time:.2f}s")
+    for result in results:
+        print("{query}: {verdict}, score {score:0.6f}, {total:.2f}s, {cache_hits} cached / {cache_misses} computed influence scores".format(
+            verdict="ALERT" if result["alert"] else "no alert", total=result["timings"]["total"], **result))
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,108 @@
+# Scaling benchmark of the POIROT stages on synthetic provenance graphs.
+# For every combination of graph size, threshold and query hop count, a seeded
+# synthetic graph with the query planted in it is generated (see synthetic.py)
+# and each stage is timed separately:
+#   find_candidate_node_alignments_with_custom_comparison, search_expansion,
+#   find_graph_alignment and compute_alignment_score.
+# Results are written as JSON, one record per configuration, so runs can be
+# compared to track regressions. Stage output is suppressed while timing, and
+# the profiling counters (influence scores, hitting-set solves, nodes visited,
+# ...) of each configuration are recorded with its timings.
+#
+# usage: python benchmark.py <output json> [--sizes 100,200,400,800,1600] [--thresholds 2,3]
+#        [--hops 1,2,3] [--fan-outs 2] [--seed 0]
+
+import argparse
+import contextlib
+import io
+import json
+import platform
+import time
+import graph_indexes
+import main
+import poirot
+import profiling
+import scores
+import synthetic
+
+DEFAULT_SIZES = [100, 200, 400, 800, 1600]
+DEFAULT_THRESHOLDS = [2, 3]
+DEFAULT_HOPS = [1, 2, 3]
+DEFAULT_FAN_OUTS = [2]
+
+def timed(timings, stage, function, *args):
+    with contextlib.redirect_stdout(io.StringIO()), profiling.stage(stage, timings):
+        result = function(*args)
+    return result
+
+def run_configuration(size, threshold, hops, fan_out=2, seed=0):
+    '''
+    returns: a dict describing the configuration, the graph, the time spent
+            in each stage (seconds) and the outcome
+    '''
+    query_graph = synthetic.generate_query_graph(hops, seed)
+    start_time = time.perf_counter()
+    provenance_graph, planted = synthetic.generate_provenance_graph(size, fan_out=fan_out, attacks=[query_graph], seed=seed)
+    record = {"size": size, "threshold": threshold, "hops": hops, "fan_out": fan_out, "seed": seed,
+              "nodes": provenance_graph.number_of_nodes(), "edges": provenance_graph.number_of_edges(),
+              "generation_seconds": time.perf_counter() - start_time}
+    timings = {}
+    profiling.profiler.reset()
+    candidate_alignments = timed(timings, "find_candidate_node_alignments_with_custom_comparison",
+                                 poirot.find_candidate_node_alignments_with_custom_comparison,
+                                 query_graph, provenance_graph, main.compare)
+    record["candidates"] = {str(query_node): len(candidates) for query_node, candidates in candidate_alignments.items()}
+    seed_node = poirot.select_seed_node(candidate_alignments, 0)
+    subset_candidate_alignments = timed(timings, "search_expansion", poirot.search_expansion,
+                                        candidate_alignments, seed_node, query_graph, provenance_graph, threshold)
+    graph_alignment = None
+    alignment_score = None
+    if subset_candidate_alignments.keys() == candidate_alignments.keys():
+        graph_alignment = timed(timings, "find_graph_alignment", poirot.find_graph_alignment,
+                                query_graph, provenance_graph, threshold, seed_node, subset_candidate_alignments)
+        alignment_score = timed(timings, "compute_alignment_score", scores.compute_alignment_score,
+                                query_graph, provenance_graph, graph_alignment, threshold)
+    record["timings"] = timings
+    record["counters"] = profiling.profiler.report()["counters"]
+    record["total_seconds"] = sum(timings.values())
+    record["score"] = alignment_score
+    record["alert"] = alignment_score is not None and alignment_score >= 1.0/float(threshold)
+    record["found_planted"] = graph_alignment == planted[0]
+    # the next configuration uses a new graph, drop this one's indexes and cached scores
+    graph_indexes.invalidate(provenance_graph)
+    return record
+
+def run_benchmark(sizes=DEFAULT_SIZES, thresholds=DEFAULT_THRESHOLDS, hops=DEFAULT_HOPS,
+                  fan_outs=DEFAULT_FAN_OUTS, seed=0):
+    results = []
+    for size in sizes:
+        for fan_out in fan_outs:
+            for threshold in thresholds:
+                for hop_count in hops:
+                    record = run_configuration(size, threshold, hop_count, fan_out, seed)
+                    print("size {size} fan-out {fan_out} threshold {threshold} hops {hops}: "
+                          "{total_seconds:.3f}s, score {score}, alert {alert}".format(**record))
+                    results.append(record)
+    return {"python": platform.python_version(), "platform": platform.platform(),
+            "started": time.strftime("%Y-%m-%dT%H:%M:%S"), "results": results}
+
+def parse_list(text):
+    return [int(value) for value in text.split(",") if value]
+
+def run():
+    parser = argparse.ArgumentParser(description="Times the POIROT stages on synthetic provenance graphs.")
+    parser.add_argument("output", help="JSON file the results are written to")
+    parser.add_argument("--sizes", type=parse_list, default=DEFAULT_SIZES)
+    parser.add_argument("--thresholds", type=parse_list, default=DEFAULT_THRESHOLDS)
+    parser.add_argument("--hops", type=parse_list, default=DEFAULT_HOPS)
+    parser.add_argument("--fan-outs", type=parse_list, default=DEFAULT_FAN_OUTS)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    profiling.profiler.enabled = True
+    profiling.profiler.quiet = True
+    report = run_benchmark(args.sizes, args.thresholds, args.hops, args.fan_outs, args.seed)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+
+if __name__ == "__main__":
+    run()
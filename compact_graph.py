@@ -0,0 +1,271 @@
+# This module defines a compact, read-only provenance graph.
+# Nodes are interned to integer IDs 0..n-1, forward and reverse adjacency are
+# stored as CSR (compressed sparse row) arrays, and node types and labels are
+# stored as columns instead of one Node object per node.
+# CompactGraph implements the part of the networkx.DiGraph API that poirot,
+# scores and helpers use (graph[node], graph.nodes[node]['node'], reverse(), ...),
+# so it can be passed anywhere a provenance DiGraph is expected.
+
+import json
+import os
+import pickle
+import numpy as np
+from node import Node
+
+# array columns of the on-disk .pgraph format, one .npy file each
+PGRAPH_ARRAYS = ("indptr", "indices", "rindptr", "rindices", "type_codes", "label_offsets", "label_data")
+
+class NodeView:
+    '''
+    mimics networkx's graph.nodes: iterating yields node IDs and
+    graph.nodes[node]['node'] returns the Node stored for that ID
+    '''
+    def __init__(self, graph):
+        self._graph = graph
+
+    def __iter__(self):
+        return iter(range(self._graph.number_of_nodes()))
+
+    def __len__(self):
+        return self._graph.number_of_nodes()
+
+    def __contains__(self, node):
+        return node in self._graph
+
+    def __getitem__(self, node):
+        return {'node': self._graph.node(node)}
+
+class UndirectedView:
+    '''
+    undirected view of a CompactGraph, neighbors are the union of
+    successors and predecessors (no arrays are copied)
+    '''
+    def __init__(self, graph):
+        self._graph = graph
+        self.nodes = graph.nodes
+
+    def __getitem__(self, node):
+        neighbors = dict.fromkeys(self._graph.successors(node))
+        neighbors.update(dict.fromkeys(self._graph.predecessors(node)))
+        return list(neighbors)
+
+    def __contains__(self, node):
+        return node in self._graph
+
+    def __iter__(self):
+        return iter(self.nodes)
+
+    def __len__(self):
+        return len(self.nodes)
+
+class CompactGraph:
+    '''
+    params: indptr, indices: CSR forward adjacency, successors of node i are indices[indptr[i]:indptr[i+1]]
+            rindptr, rindices: CSR reverse adjacency (predecessors)
+            type_codes: per-node index into type_names
+            type_names: list of distinct node type strings
+            label_offsets, label_data: per-node label i is label_data[label_offsets[i]:label_offsets[i+1]] (utf-8)
+            ids: original node IDs, or None when every original ID equals the node's label
+    '''
+    def __init__(self, indptr, indices, rindptr, rindices, type_codes, type_names,
+                 label_offsets, label_data, ids=None):
+        self.indptr = indptr
+        self.indices = indices
+        self.rindptr = rindptr
+        self.rindices = rindices
+        self.type_codes = type_codes
+        self.type_names = list(type_names)
+        self.label_offsets = label_offsets
+        self.label_data = label_data
+        self.ids = ids
+        self.graph = {}
+        self.nodes = NodeView(self)
+        self._index = None
+
+    def __getitem__(self, node):
+        return self.successors(node)
+
+    def __contains__(self, node):
+        return isinstance(node, (int, np.integer)) and 0 <= node < self.number_of_nodes()
+
+    def __iter__(self):
+        return iter(self.nodes)
+
+    def __len__(self):
+        return self.number_of_nodes()
+
+    def number_of_nodes(self):
+        return len(self.type_codes)
+
+    def number_of_edges(self):
+        return len(self.indices)
+
+    def has_node(self, node):
+        return node in self
+
+    def successors(self, node):
+        return self.indices[self.indptr[node]:self.indptr[node + 1]].tolist()
+
+    def predecessors(self, node):
+        return self.rindices[self.rindptr[node]:self.rindptr[node + 1]].tolist()
+
+    neighbors = successors
+
+    def has_edge(self, u, v):
+        return v in self.successors(u)
+
+    def edges(self):
+        for u in range(self.number_of_nodes()):
+            for v in self.successors(u):
+                yield u, v
+
+    def reverse(self, copy=True):
+        '''
+        returns the graph with all edges reversed; the CSR arrays are
+        shared, so this never copies regardless of copy
+        '''
+        return CompactGraph(self.rindptr, self.rindices, self.indptr, self.indices,
+                            self.type_codes, self.type_names,
+                            self.label_offsets, self.label_data, self.ids)
+
+    def to_undirected(self):
+        return UndirectedView(self)
+
+    def node_type(self, node):
+        return self.type_names[self.type_codes[node]]
+
+    def node_label(self, node):
+        start, end = self.label_offsets[node], self.label_offsets[node + 1]
+        return self.label_data[start:end].tobytes().decode('utf-8')
+
+    def node_id(self, node):
+        '''
+        returns the original (pre-interning) ID of an integer node
+        '''
+        if self.ids is None:
+            return self.node_label(node)
+        return self.ids[node]
+
+    def node(self, node):
+        label = self.node_label(node)
+        node_id = label if self.ids is None else self.ids[node]
+        return Node(node_id, self.node_type(node), label)
+
+    def node_index(self, node_id):
+        '''
+        returns the integer node for an original node ID,
+        the lookup table is built on first use
+        '''
+        if self._index is None:
+            self._index = {self.node_id(node): node for node in range(self.number_of_nodes())}
+        return self._index[node_id]
+
+def build_csr(sources, targets, num_nodes):
+    '''
+    params: sources, targets: integer arrays of edge endpoints
+            num_nodes: number of nodes
+    returns: (indptr, indices) with each node's neighbors sorted
+    '''
+    order = np.lexsort((targets, sources))
+    indptr = np.zeros(num_nodes + 1, dtype=np.int64)
+    np.cumsum(np.bincount(sources, minlength=num_nodes), out=indptr[1:])
+    indices = targets[order].astype(index_dtype(num_nodes))
+    return indptr, indices
+
+def index_dtype(num_nodes):
+    return np.int32 if num_nodes < 2**31 else np.int64
+
+def encode_labels(labels):
+    '''
+    packs a list of label strings into (offsets, utf-8 data) columns
+    '''
+    encoded = [str(label).encode('utf-8') for label in labels]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(label) for label in encoded], out=offsets[1:])
+    data = np.frombuffer(b''.join(encoded), dtype=np.uint8)
+    return offsets, data
+
+def from_columns(ids, types, labels, sources, targets):
+    '''
+    builds a CompactGraph from node columns and integer edge endpoints
+    params: ids, types, labels: per-node original ID, type and label
+            sources, targets: integer node positions of each edge
+    returns: a CompactGraph
+    '''
+    num_nodes = len(ids)
+    type_names = sorted(set(types))
+    type_index = {node_type: code for code, node_type in enumerate(type_names)}
+    type_codes = np.array([type_index[node_type] for node_type in types], dtype=np.int16)
+    label_offsets, label_data = encode_labels(labels)
+    if all(isinstance(node_id, str) and node_id == label for node_id, label in zip(ids, labels)):
+        ids = None
+    else:
+        ids = list(ids)
+
+    sources = np.asarray(sources, dtype=np.int64)
+    targets = np.asarray(targets, dtype=np.int64)
+    indptr, indices = build_csr(sources, targets, num_nodes)
+    rindptr, rindices = build_csr(targets, sources, num_nodes)
+    return CompactGraph(indptr, indices, rindptr, rindices, type_codes, type_names,
+                        label_offsets, label_data, ids)
+
+def from_networkx(graph):
+    '''
+    converts a networkx provenance graph (as returned by loaders.load_pickle_graph)
+    params: graph: networkx.DiGraph whose nodes carry a 'node' attribute
+    returns: a CompactGraph; integer node i corresponds to the i-th node of graph.nodes
+    '''
+    ids = list(graph.nodes)
+    index = {node_id: i for i, node_id in enumerate(ids)}
+    nodes = [graph.nodes[node_id]['node'] for node_id in ids]
+    types = [node.type for node in nodes]
+    labels = [node.label for node in nodes]
+    num_edges = graph.number_of_edges()
+    sources = np.fromiter((index[u] for u, _ in graph.edges), dtype=np.int64, count=num_edges)
+    targets = np.fromiter((index[v] for _, v in graph.edges), dtype=np.int64, count=num_edges)
+    return from_columns(ids, types, labels, sources, targets)
+
+def save(graph, path):
+    '''
+    writes a CompactGraph as a .pgraph directory: one .npy file per array
+    column plus meta.json (and ids.pkl when original IDs differ from labels)
+    params: graph: CompactGraph to save
+            path: output directory, conventionally ending in .pgraph
+    '''
+    os.makedirs(path, exist_ok=True)
+    for name in PGRAPH_ARRAYS:
+        np.save(os.path.join(path, name + ".npy"), np.ascontiguousarray(getattr(graph, name)))
+    ids_file = os.path.join(path, "ids.pkl")
+    if graph.ids is not None:
+        with open(ids_file, "wb") as f:
+            pickle.dump(graph.ids, f)
+    elif os.path.exists(ids_file):
+        os.remove(ids_file)
+    meta = {"version": 1,
+            "num_nodes": graph.number_of_nodes(),
+            "num_edges": graph.number_of_edges(),
+            "type_names": graph.type_names}
+    with open(os.path.join(path, "meta.json"), "w") as f:
+        json.dump(meta, f)
+
+def load(path, mmap=True):
+    '''
+    loads a .pgraph directory written by save
+    params: path: the .pgraph directory
+            mmap: memory-map the arrays read-only instead of reading them,
+            so startup is near-instant and processes share the page cache
+    returns: a CompactGraph
+    '''
+    with open(os.path.join(path, "meta.json"), "r") as f:
+        meta = json.load(f)
+    mmap_mode = "r" if mmap else None
+    arrays = {name: np.load(os.path.join(path, name + ".npy"), mmap_mode=mmap_mode)
+              for name in PGRAPH_ARRAYS}
+    ids = None
+    ids_file = os.path.join(path, "ids.pkl")
+    if os.path.exists(ids_file):
+        with open(ids_file, "rb") as f:
+            ids = pickle.load(f)
+    return CompactGraph(arrays["indptr"], arrays["indices"], arrays["rindptr"], arrays["rindices"],
+                        arrays["type_codes"], meta["type_names"],
+                        arrays["label_offsets"], arrays["label_data"], ids)
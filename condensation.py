@@ -0,0 +1,82 @@
+# Condensation of a directed graph into the DAG of its strongly connected
+# components. Provenance graphs are full of cycles (a process reading and
+# writing the same files, processes signalling each other, ...), and all nodes
+# of a cycle share their ancestors, descendants and reachability, so indexes
+# over those properties are computed once per component on the DAG instead of
+# once per node. Components are numbered in topological order: every edge of
+# the DAG goes from a lower to a higher component number, so a single pass in
+# increasing (or decreasing) order visits all predecessors (or successors) of a
+# component before the component itself.
+
+class Condensation:
+    '''
+    params: nodes: the nodes of the graph
+            neighbors: function returning the successors of a node, only
+            successors that are in nodes may be returned
+    '''
+    def __init__(self, nodes, neighbors):
+        self.component = {}
+        self.members = list(strongly_connected_components(nodes, neighbors))
+        # Tarjan's algorithm emits components in reverse topological order
+        self.members.reverse()
+        for number, members in enumerate(self.members):
+            for node in members:
+                self.component[node] = number
+        successors = [set() for _ in self.members]
+        predecessors = [set() for _ in self.members]
+        for number, members in enumerate(self.members):
+            for node in members:
+                for neighbor in neighbors(node):
+                    successor = self.component[neighbor]
+                    if successor != number:
+                        successors[number].add(successor)
+                        predecessors[successor].add(number)
+        self.successors = [sorted(components) for components in successors]
+        self.predecessors = [sorted(components) for components in predecessors]
+
+    def __len__(self):
+        return len(self.members)
+
+def strongly_connected_components(nodes, neighbors):
+    '''
+    iterative Tarjan's algorithm
+    params: nodes: nodes to start from
+            neighbors: function returning the successors of a node
+    returns: generator of components (lists of nodes) in reverse topological order
+    '''
+    index = {}
+    lowlink = {}
+    stack = []
+    on_stack = set()
+    for root in nodes:
+        if root in index:
+            continue
+        index[root] = lowlink[root] = len(index)
+        stack.append(root)
+        on_stack.add(root)
+        work = [(root, iter(neighbors(root)))]
+        while work:
+            node, remaining = work[-1]
+            for neighbor in remaining:
+                if neighbor not in index:
+                    index[neighbor] = lowlink[neighbor] = len(index)
+                    stack.append(neighbor)
+                    on_stack.add(neighbor)
+                    work.append((neighbor, iter(neighbors(neighbor))))
+                    break
+                elif neighbor in on_stack:
+                    lowlink[node] = min(lowlink[node], index[neighbor])
+            else:
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    lowlink[parent] = min(lowlink[parent], lowlink[node])
+                if lowlink[node] == index[node]:
+                    component = []
+                    while True:
+                        member = stack.pop()
+                        on_stack.discard(member)
+                        component.append(member)
+                        if member == node:
+                            break
+                    yield component
@@ -0,0 +1,102 @@
+# Bulk construction of provenance graphs from columnar event data.
+# The converters used to build graphs one DataFrame row at a time, creating two
+# Node objects and calling add_node twice per event. GraphBuilder instead takes
+# whole subject/object/type columns per batch: node types are deduplicated with
+# one dict update per batch (first appearance fixes a node's position, its last
+# type wins, as with repeated add_node calls), events are grouped into edges
+# with pandas, and the graph is materialized once with add_nodes_from and
+# add_edges_from. Each edge keeps the syscall of its first event and the
+# earliest timestamp as 'syscall' and 'timestamp' attributes. Missing
+# timestamps (None, NaN or "") are skipped when taking the earliest one.
+
+import networkx as nx
+import numpy as np
+import pandas as pd
+from node import Node
+
+EVENT_COLUMNS = ['subjectname', 'subject_type', 'objectname', 'object_type', 'syscall', 'timestamp']
+
+class GraphBuilder:
+    def __init__(self):
+        self.node_types = {}
+        self.edges = {}
+
+    def add_batch(self, subjects, subject_types, objects, object_types, syscalls=None, timestamps=None):
+        '''
+        params: subjects, subject_types, objects, object_types: per-event columns
+                syscalls, timestamps: optional per-event columns
+        '''
+        count = len(subjects)
+        if count == 0:
+            return
+        names = np.empty(2 * count, dtype=object)
+        names[0::2] = subjects
+        names[1::2] = objects
+        types = np.empty(2 * count, dtype=object)
+        types[0::2] = subject_types
+        types[1::2] = object_types
+        self.node_types.update(zip(names.tolist(), types.tolist()))
+
+        timestamps = pd.Series(timestamps if timestamps is not None else None, index=range(count), dtype=object)
+        timestamps = timestamps.where(timestamps.notna() & (timestamps != ""), None)
+        events = pd.DataFrame({'subject': names[0::2], 'object': names[1::2],
+                               'syscall': syscalls if syscalls is not None else None,
+                               'timestamp': timestamps})
+        grouped = events.groupby(['subject', 'object'], sort=False, dropna=False).agg(syscall=('syscall', 'first'))
+        # the minimum is only taken over the events that have a timestamp
+        timed = events[events['timestamp'].notna()]
+        grouped['timestamp'] = timed.groupby(['subject', 'object'], sort=False, dropna=False)['timestamp'].min()
+        grouped = grouped.astype(object).where(grouped.notna(), None)
+        for key, syscall, timestamp in zip(grouped.index, grouped['syscall'].tolist(), grouped['timestamp'].tolist()):
+            self.add_edge(key, syscall, timestamp)
+
+    def add_dataframe(self, df):
+        '''
+        params: df: event table with the EVENT_COLUMNS columns (syscall and timestamp optional)
+        '''
+        self.add_batch(df['subjectname'].to_numpy(), df['subject_type'].to_numpy(),
+                       df['objectname'].to_numpy(), df['object_type'].to_numpy(),
+                       df['syscall'].to_numpy() if 'syscall' in df else None,
+                       df['timestamp'].to_numpy() if 'timestamp' in df else None)
+
+    def add_records(self, records):
+        '''
+        params: records: list of (subjectname, subject_type, objectname, object_type, syscall, timestamp) tuples
+        '''
+        if records:
+            self.add_batch(*[list(column) for column in zip(*records)])
+
+    def update(self, other):
+        '''
+        merges the nodes and edges of another builder, as if its batches were added after ours
+        '''
+        self.node_types.update(other.node_types)
+        for key, (syscall, timestamp) in other.edges.items():
+            self.add_edge(key, syscall, timestamp)
+
+    def add_edge(self, key, syscall, timestamp):
+        edge = self.edges.get(key)
+        if edge is None:
+            self.edges[key] = (syscall, timestamp)
+        elif timestamp is not None and (edge[1] is None or timestamp < edge[1]):
+            self.edges[key] = (edge[0], timestamp)
+
+    def graph(self):
+        '''
+        returns: the networkx.DiGraph of the events added so far
+        '''
+        G = nx.DiGraph()
+        G.add_nodes_from((name, {'node': Node(name, node_type, name)})
+                         for name, node_type in self.node_types.items())
+        G.add_edges_from((subject, obj, {'syscall': syscall, 'timestamp': timestamp})
+                         for (subject, obj), (syscall, timestamp) in self.edges.items())
+        return G
+
+def build_graph(df):
+    '''
+    params: df: event table with the EVENT_COLUMNS columns
+    returns: the networkx.DiGraph of the events
+    '''
+    builder = GraphBuilder()
+    builder.add_dataframe(df)
+    return builder.graph()
@@ -0,0 +1,59 @@
+# Per-graph cache for derived indexes (process ancestors, node lookups, ...).
+# An index is built the first time it is requested for a graph and reused
+# afterwards. Entries are dropped when the graph is garbage collected or its
+# node count changes; code that adds or removes edges in place must call
+# invalidate(graph) (or retain(graph, names) for indexes they update
+# themselves, see cached). Builders must not keep a reference to the graph itself,
+# otherwise the graph could never be collected.
+
+import weakref
+
+_indexes = weakref.WeakKeyDictionary()
+
+def get_index(graph, name, builder):
+    '''
+    params: graph: provenance graph the index is derived from
+            name: name of the index
+            builder: function building the index from the graph
+    returns: the cached index, building it with builder(graph) if needed
+    '''
+    signature = graph.number_of_nodes()
+    entry = _indexes.get(graph)
+    if entry is None or entry[0] != signature:
+        entry = (signature, {})
+        _indexes[graph] = entry
+    indexes = entry[1]
+    if name not in indexes:
+        indexes[name] = builder(graph)
+    return indexes[name]
+
+def cached(graph, name):
+    '''
+    returns: the index called name if it is cached for graph, else None
+    '''
+    entry = _indexes.get(graph)
+    if entry is None or entry[0] != graph.number_of_nodes():
+        return None
+    return entry[1].get(name)
+
+def invalidate(graph, name=None):
+    '''
+    drops the cached index called name for graph (all of them if name is None)
+    '''
+    entry = _indexes.get(graph)
+    if entry is None:
+        return
+    if name is None:
+        del _indexes[graph]
+    else:
+        entry[1].pop(name, None)
+
+def retain(graph, names):
+    '''
+    after graph was changed in place, drops every cached index except the
+    ones called names, which the caller has brought up to date itself
+    '''
+    entry = _indexes.get(graph)
+    if entry is None:
+        return
+    _indexes[graph] = (graph.number_of_nodes(), {name: entry[1][name] for name in names if name in entry[1]})
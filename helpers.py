@@ -1,6 +1,8 @@
 import scores
+import temporal
+import traversal
 
-def do_dfs(graph, node, visited, threshold):
+def do_dfs(graph, node, visited, threshold, direction="forward", steps=None, bounds=None):
     '''
     given start node, perform
     forward and backward traversal using dfs
@@ -8,35 +10,74 @@ def do_dfs(graph, node, visited, threshold):
             node: start node
             visited: track nodes that have been visited
             threshold: limit for number of compromises
+            direction: "forward" follows edges, "reverse" follows them backwards
+            (as on graph.reverse(), without copying the graph)
+            steps: optional temporal.neighbor_function for direction, to only
+            follow edges in a time window or along time-respecting paths
+            bounds: dict of the best bound each visited node was reached with,
+            needed with time-respecting steps: a visited node is entered again
+            when a later path reaches it with a better bound (see better_bound)
     '''
-    dfs_helper(graph, node, visited, [node], threshold)
+    dfs_helper(graph, node, visited, [node], threshold, direction=direction, steps=steps, bounds=bounds)
 
-def dfs_helper(graph, node, visited, path, threshold):
-    if node not in visited:
-        visited.add(node)
-        if scores.find_minimum_common_ancestors(graph, path) < threshold:
-            for neighbor in graph[node]:
-                dfs_helper(graph, neighbor, visited, path + [neighbor], threshold)
+def better_bound(bound, best, direction="forward"):
+    '''
+    returns: whether reaching a node with bound allows more time-respecting
+            continuations than reaching it with best: an earlier bound going
+            forward, a later one going in reverse, and None (no constraint) is best
+    '''
+    if best is None:
+        return False
+    if bound is None:
+        return True
+    return bound > best if direction == "reverse" else bound < best
+
+def dfs_helper(graph, node, visited, path, threshold, path_cost=None, direction="forward", steps=None, bound=None, bounds=None):
+    '''
+    iterative threshold-bounded dfs, a node is only expanded while the
+    path leading to it needs fewer than threshold compromises.
+    path ends with node; path_cost tracks the number of compromises of
+    path[:-1] and is updated as nodes are pushed and popped, instead of
+    recomputing it for the whole path at every step.
+    steps and bound: see temporal.neighbor_function, bound is that of node
+    bounds: see do_dfs
+    '''
+    def enter(node, bound):
+        if node not in visited:
+            visited.add(node)
+        elif bounds is None or node not in bounds or not better_bound(bound, bounds[node], direction):
+            return False
+        if bounds is not None:
+            bounds[node] = bound
+        return True
+
+    if steps is None:
+        steps = temporal.neighbor_function(graph, direction)
+    if path_cost is None:
+        path_cost = scores.PathCost(graph, threshold, reverse=direction == "reverse")
+        for path_node in path[:-1]:
+            path_cost.push(path_node)
+    if not enter(node, bound):
+        return
+    path_cost.push(node)
+    stack = [iter(steps(node, bound)) if path_cost.cost < threshold else iter(())]
+    while stack:
+        for neighbor, neighbor_bound in stack[-1]:
+            if enter(neighbor, neighbor_bound):
+                path.append(neighbor)
+                path_cost.push(neighbor)
+                stack.append(iter(steps(neighbor, neighbor_bound)) if path_cost.cost < threshold else iter(()))
+                break
+        else:
+            stack.pop()
+            path_cost.pop()
+            if stack:
+                path.pop()
 
-def do_simple_dfs(graph, node, visited=None):
-    if visited is None:
-        visited = set()
-    if node not in visited:
-        visited.add(node)
-        if node in graph:
-            for neighbor in graph[node]:
-                do_simple_dfs(graph, neighbor, visited)
-    return visited
+def do_simple_dfs(graph, node, visited=None, direction="forward"):
+    return traversal.dfs(graph, node, direction, visited)
 
 def do_simple_undirected_bfs(graph, node):
-    undirected = graph.to_undirected()
-    queue = [node]
-    visited = [node]
-    while len(queue) > 0:
-        curr = queue.pop(0)
-        for neighbor in undirected[curr]:
-            if neighbor not in visited:
-                visited.append(neighbor)
-                queue.append(neighbor)
-    
-    return visited
\ No newline at end of file
+    # the visiting order is the order find_graph_alignment aligns query nodes
+    # in, keep that of the undirected copy; query graphs are tiny to copy
+    return traversal.bfs(graph.to_undirected(), node)
@@ -1,15 +1,152 @@
-import itertools
-
-def minimum_hitting_set(sets):
-    total = set().union(*sets)
-    for length in range(1, len(total)):
-        combinations = itertools.combinations(total, length)
-        for combination in combinations:
-            for ancestor_set in sets:
-                if len(ancestor_set.intersection(set(combination))) == 0:
-                    break
-            else:
-                return combination
-
-sets = [{1, 2}, {2, 3}]
-print(minimum_hitting_set(sets))
\ No newline at end of file
+# Exact minimum hitting set solver shared by scores and the path searches.
+# A hitting set of a collection of sets is a collection of elements that
+# intersects every set. Finding a minimum one is NP-complete, but callers
+# only care whether the minimum is at most some limit, so the solver reduces
+# the instance (dominated sets and elements, forced unit sets) and runs a
+# branch-and-bound that gives up as soon as the limit is provably exceeded.
+# Sets are encoded internally as integer bitsets over the distinct elements.
+
+import profiling
+
+def minimum_hitting_set(sets, limit=None):
+    '''
+    params: sets: list of sets to hit
+            limit: optional upper bound; when every hitting set is larger
+            than limit the search stops early
+    returns: a tuple of elements forming a minimum hitting set, or None if
+            the minimum exceeds limit or some set is empty
+    '''
+    profiling.count("hitting_set_solves")
+    elements = list(set().union(*sets))
+    position = {element: i for i, element in enumerate(elements)}
+    masks = []
+    for element_set in sets:
+        mask = 0
+        for element in element_set:
+            mask |= 1 << position[element]
+        masks.append(mask)
+    chosen = solve(masks, limit)
+    if chosen is None:
+        return None
+    return tuple(elements[i] for i in bit_positions(chosen))
+
+def minimum_hitting_set_size(sets, limit=None):
+    '''
+    params: sets: list of sets to hit
+            limit: optional upper bound on the interesting sizes
+    returns: the size of a minimum hitting set, or limit + 1 (a sentinel
+            meaning "exceeds limit") when the minimum is larger than limit
+    '''
+    hitting_set = minimum_hitting_set(sets, limit)
+    if hitting_set is None:
+        return float('inf') if limit is None else limit + 1
+    return len(hitting_set)
+
+def solve(masks, limit=None):
+    '''
+    params: masks: sets to hit as integer bitsets
+            limit: optional upper bound on the hitting set size
+    returns: bitset of a minimum hitting set, or None if it exceeds limit
+    '''
+    if any(mask == 0 for mask in masks):
+        return None
+    forced, masks = reduce(masks)
+    budget = float('inf') if limit is None else limit - bin(forced).count('1')
+    if budget < 0:
+        return None
+    if not masks:
+        return forced
+    best = branch(masks, 0, 0, budget)
+    if best is None:
+        return None
+    return forced | best[1]
+
+def reduce(masks):
+    '''
+    repeatedly applies the reduction rules:
+      - a set that contains another set is dropped (hitting the smaller one hits it)
+      - an element of a unit set is forced into the solution
+      - an element whose sets are a subset of another element's sets is dropped
+    returns: (bitset of forced elements, reduced list of masks)
+    '''
+    forced = 0
+    changed = True
+    while changed and masks:
+        changed = False
+        masks = remove_supersets(masks)
+        units = 0
+        for mask in masks:
+            if mask & (mask - 1) == 0:
+                units |= mask
+        if units:
+            forced |= units
+            masks = [mask for mask in masks if mask & units == 0]
+            changed = True
+            continue
+        reduced = remove_dominated_elements(masks)
+        if reduced != masks:
+            masks = reduced
+            changed = True
+    return forced, masks
+
+def remove_supersets(masks):
+    kept = []
+    for mask in sorted(set(masks), key=lambda mask: bin(mask).count('1')):
+        if all(mask & other != other for other in kept):
+            kept.append(mask)
+    return kept
+
+def remove_dominated_elements(masks):
+    occurrences = {}
+    for i, mask in enumerate(masks):
+        for element in bit_positions(mask):
+            occurrences[element] = occurrences.get(element, 0) | (1 << i)
+    dominated = 0
+    elements = sorted(occurrences, key=lambda element: bin(occurrences[element]).count('1'))
+    for i, element in enumerate(elements):
+        sets = occurrences[element]
+        for other in elements[i + 1:]:
+            if not dominated & (1 << other) and sets & occurrences[other] == sets:
+                dominated |= 1 << element
+                break
+    if not dominated:
+        return masks
+    return [mask & ~dominated for mask in masks]
+
+def lower_bound(masks):
+    '''
+    greedy packing of pairwise disjoint sets, each needs its own element
+    '''
+    used = 0
+    count = 0
+    for mask in sorted(masks, key=lambda mask: bin(mask).count('1')):
+        if mask & used == 0:
+            used |= mask
+            count += 1
+    return count
+
+def branch(masks, chosen, size, budget):
+    '''
+    returns: (size, bitset) of the best completion of chosen using at most
+            budget elements in total, or None if there is none
+    '''
+    if not masks:
+        return size, chosen
+    if size + lower_bound(masks) > budget:
+        return None
+    best = None
+    smallest = min(masks, key=lambda mask: bin(mask).count('1'))
+    frequency = {element: sum(1 for mask in masks if mask >> element & 1) for element in bit_positions(smallest)}
+    for element in sorted(frequency, key=frequency.get, reverse=True):
+        bit = 1 << element
+        result = branch([mask for mask in masks if mask & bit == 0], chosen | bit, size + 1, budget)
+        if result is not None:
+            best = result
+            budget = result[0] - 1
+    return best
+
+def bit_positions(bits):
+    '''
+    returns: positions of the set bits of an integer bitset
+    '''
+    return [position for position, bit in enumerate(reversed(bin(bits)[2:])) if bit == '1']
@@ -0,0 +1,78 @@
+# Memoization of influence scores across the POIROT stages.
+# find_graph_alignment, compute_alignment_score and every seed node tried by
+# main score many of the same (node_a, node_b) pairs. Scores are cached per
+# provenance graph, keyed by (node_a, node_b, threshold), in a bounded LRU.
+# The cache lives in graph_indexes, so it is dropped together with the graph's
+# other indexes when the graph changes (graph_indexes.invalidate(graph)).
+
+from collections import OrderedDict
+import graph_indexes
+
+# maximum number of cached scores per graph
+MAXSIZE = 1000000
+
+class InfluenceCache:
+    def __init__(self, maxsize=None):
+        self.maxsize = MAXSIZE if maxsize is None else maxsize
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # when a list, put() also appends the (key, score) pairs it stores to it,
+        # so forked workers can send the scores they computed back to the parent
+        self.journal = None
+        self._scores = OrderedDict()
+
+    def __len__(self):
+        return len(self._scores)
+
+    def get(self, key):
+        '''
+        returns: the cached score for key, or None on a miss
+        '''
+        score = self._scores.get(key)
+        if score is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._scores.move_to_end(key)
+        return score
+
+    def put(self, key, score):
+        if self.journal is not None:
+            self.journal.append((key, score))
+        self._scores[key] = score
+        self._scores.move_to_end(key)
+        while len(self._scores) > self.maxsize:
+            self._scores.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, nodes=None):
+        '''
+        drops the cached scores of pairs with an endpoint in nodes,
+        or every cached score if nodes is None
+        '''
+        if nodes is None:
+            self._scores.clear()
+            return
+        nodes = set(nodes)
+        stale = [key for key in self._scores if key[0] in nodes or key[1] in nodes]
+        for key in stale:
+            del self._scores[key]
+
+    def invalidate_targets(self, nodes):
+        '''
+        drops the cached scores of pairs whose end node is in nodes
+        returns: the number of scores dropped
+        '''
+        nodes = set(nodes)
+        stale = [key for key in self._scores if key[1] in nodes]
+        for key in stale:
+            del self._scores[key]
+        return len(stale)
+
+    def stats(self):
+        return {"size": len(self._scores), "maxsize": self.maxsize, "hits": self.hits,
+                "misses": self.misses, "evictions": self.evictions}
+
+def get_influence_cache(graph):
+    return graph_indexes.get_index(graph, "influence_scores", lambda graph: InfluenceCache())
@@ -0,0 +1,156 @@
+# Pattern matching of query node labels against provenance node labels.
+# A query label can be a pattern instead of an exact name:
+#   glob:  prefixed with "glob:" (fnmatch syntax, * also matches "/"), e.g. glob:/tmp/*.sh or glob:*/bash
+#   CIDR:  an IP network such as 10.0.0.0/8, matched against the leading address of a label
+#   regex: prefixed with "re:", e.g. re:^/etc/(passwd|shadow)$ (re.search semantics)
+# Other labels, including file names that contain *, ? or [, are plain names.
+# PatternIndex resolves a pattern over the distinct labels of one node type
+# without testing every label: a sorted label array answers literal prefixes
+# (it plays the role of a path trie), a sorted array of reversed labels answers
+# suffixes like */bash, and sorted integer addresses answer CIDR ranges.
+# Only globs with neither a literal prefix nor a plain suffix, and regexes,
+# fall back to testing each distinct label.
+
+import bisect
+import fnmatch
+import ipaddress
+import re
+from functools import lru_cache
+
+GLOB_CHARACTERS = "*?["
+
+class LabelPattern:
+    def __init__(self, kind, text):
+        self.kind = kind
+        self.text = text
+        if kind == "glob":
+            self.regex = re.compile(fnmatch.translate(text))
+        elif kind == "regex":
+            self.regex = re.compile(text)
+        elif kind == "cidr":
+            self.network = ipaddress.ip_network(text, strict=False)
+
+    def __eq__(self, other):
+        return isinstance(other, LabelPattern) and (self.kind, self.text) == (other.kind, other.text)
+
+    def __hash__(self):
+        return hash((self.kind, self.text))
+
+    def __repr__(self):
+        return f"LabelPattern({self.kind!r}, {self.text!r})"
+
+    def matches(self, label):
+        if self.kind == "cidr":
+            address = parse_address(label)
+            return address is not None and address.version == self.network.version and address in self.network
+        if self.kind == "glob":
+            return self.regex.match(label) is not None
+        return self.regex.search(label) is not None
+
+@lru_cache(maxsize=4096)
+def parse_pattern(label):
+    '''
+    params: label: label of a query node
+    returns: the LabelPattern the label describes, or None for a plain label
+    '''
+    if label.startswith("re:"):
+        return LabelPattern("regex", label[3:])
+    if label.startswith("glob:"):
+        return LabelPattern("glob", label[5:])
+    if "/" in label:
+        try:
+            return LabelPattern("cidr", label)
+        except ValueError:
+            pass
+    return None
+
+def parse_address(label):
+    '''
+    returns: the IP address a label starts with ("1.2.3.4", "1.2.3.4 80",
+            "1.2.3.4:80", "[::1]:80"), or None
+    '''
+    parts = label.split()
+    if len(parts) == 0:
+        return None
+    token = parts[0]
+    if token.startswith("["):
+        token = token[1:].split("]")[0]
+    elif token.count(":") == 1:
+        token = token.split(":")[0]
+    try:
+        return ipaddress.ip_address(token)
+    except ValueError:
+        return None
+
+class PatternIndex:
+    '''
+    params: label_positions: {label: [positions]} of the nodes of one type
+    '''
+    def __init__(self, label_positions):
+        self.label_positions = label_positions
+        self.sorted_labels = sorted(label_positions)
+        self._reversed_labels = None
+        self._addresses = None
+        self._resolved = {}
+
+    def prefix_labels(self, prefix):
+        start = bisect.bisect_left(self.sorted_labels, prefix)
+        end = start
+        while end < len(self.sorted_labels) and self.sorted_labels[end].startswith(prefix):
+            end += 1
+        return self.sorted_labels[start:end]
+
+    def suffix_labels(self, suffix):
+        if self._reversed_labels is None:
+            self._reversed_labels = sorted(label[::-1] for label in self.label_positions)
+        reversed_suffix = suffix[::-1]
+        start = bisect.bisect_left(self._reversed_labels, reversed_suffix)
+        labels = []
+        for reversed_label in self._reversed_labels[start:]:
+            if not reversed_label.startswith(reversed_suffix):
+                break
+            labels.append(reversed_label[::-1])
+        return labels
+
+    def network_labels(self, network):
+        if self._addresses is None:
+            addresses = {4: [], 6: []}
+            for label in self.label_positions:
+                address = parse_address(label)
+                if address is not None:
+                    addresses[address.version].append((int(address), label))
+            self._addresses = {version: sorted(pairs) for version, pairs in addresses.items()}
+        pairs = self._addresses[network.version]
+        start = bisect.bisect_left(pairs, (int(network.network_address), ""))
+        end = bisect.bisect_right(pairs, (int(network.broadcast_address), "\U0010ffff"))
+        return [label for _, label in pairs[start:end]]
+
+    def resolve(self, pattern):
+        '''
+        returns: the distinct labels matching pattern
+        '''
+        if pattern in self._resolved:
+            return self._resolved[pattern]
+        if pattern.kind == "cidr":
+            labels = self.network_labels(pattern.network)
+        elif pattern.kind == "glob":
+            text = pattern.text
+            first_wildcard = min((text.index(character) for character in GLOB_CHARACTERS if character in text), default=len(text))
+            rest = text[1:]
+            if first_wildcard > 0:
+                candidates = self.prefix_labels(text[:first_wildcard])
+            elif text.startswith("*") and not any(character in rest for character in GLOB_CHARACTERS):
+                candidates = self.suffix_labels(rest)
+            else:
+                candidates = self.sorted_labels
+            labels = [label for label in candidates if pattern.matches(label)]
+        else:
+            labels = [label for label in self.sorted_labels if pattern.matches(label)]
+        self._resolved[pattern] = labels
+        return labels
+
+    def positions(self, pattern):
+        '''
+        returns: positions of the nodes whose label matches pattern, in graph order
+        '''
+        return sorted(position for label in self.resolve(pattern) for position in self.label_positions[label])
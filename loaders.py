@@ -2,31 +2,52 @@ import pickle
 import networkx as nx
 from node import Node
 
-def load_graph(filename):
-    if filename.split(".")[-1] == "pkl":
+def load_graph(filename, compact=False):
+    if compact:
+        import compact_graph
+        graph = load_graph(filename)
+        if isinstance(graph, compact_graph.CompactGraph):
+            # .pgraph directories are already compact
+            return graph
+        return compact_graph.from_networkx(graph)
+    if filename.rstrip("/").split(".")[-1] == "pgraph":
+        return load_pgraph_graph(filename)
+    elif filename.split(".")[-1] == "pkl":
         return load_pickle_graph(filename)
     elif filename.split(".")[-1] == "txt":
         return load_txt_graph(filename)
     elif filename.split(".")[-1] == "spt":
         return load_streamspot_graph(filename)
     else:
-        print("Filetype not recognized, please provide a networkx graph in a pickle or use the text format.")
+        print("Filetype not recognized, please provide a networkx graph in a pickle, a .pgraph directory or use the text format.")
         exit(1)
 
 def load_pickle_graph(filename):
     with open(filename, "rb") as f:
         return pickle.load(f)
-    
+
+def load_pgraph_graph(filename):
+    import compact_graph
+    return compact_graph.load(filename.rstrip("/"), mmap=True)
+
+def parse_txt_edge(line):
+    '''
+    parses one "TYPE:label -> TYPE:label" line of the text format
+    returns: (from Node, to Node)
+    '''
+    from_node_string, to_node_string = [string.strip() for string in line.split("->")]
+    from_node_type, from_node_label = from_node_string.split(":", 1)
+    to_node_type, to_node_label = to_node_string.split(":", 1)
+    from_node = Node(from_node_label, from_node_type, from_node_label)
+    to_node = Node(to_node_label, to_node_type, to_node_label)
+    return from_node, to_node
+
 def load_txt_graph(filename):
     graph = nx.DiGraph()
     with open(filename, 'r') as f:
         lines = f.readlines()
         for line in lines:
-            from_node_string, to_node_string = [string.strip() for string in line.split("->")]
-            from_node_type, from_node_label = from_node_string.split(":")
-            to_node_type, to_node_label = to_node_string.split(":")
-            from_node = Node(from_node_label, from_node_type, from_node_label)
-            to_node = Node(to_node_label, to_node_type, to_node_label)
+            from_node, to_node = parse_txt_edge(line)
             graph.add_node(from_node.id, node=from_node)
             graph.add_node(to_node.id, node=to_node)
             graph.add_edge(from_node.id, to_node.id)
@@ -1,47 +1,254 @@
 from node import Node
+import contextlib
+import multiprocessing
+import os
 import sys
+import influence_cache
+import label_index
 import loaders
 import poirot
+import process_index
+import profiling
+import pruning
+import reachability
 import scores
+import temporal
 
 def compare(query_node, provenance_node):
+    # query labels that are patterns (globs, CIDR ranges, re:...) also constrain
+    # PROCESS and IP nodes, plain labels keep the original matching
+    pattern = label_index.parse_pattern(query_node.label)
     if query_node.type == "FILE" and provenance_node.type == "FileObject":
+        if pattern is not None:
+            return pattern.matches(provenance_node.label)
         return query_node.label == provenance_node.label
     elif query_node.type == "PROCESS":
-        return provenance_node.type == "SUBJECT_PROCESS"
+        return provenance_node.type == "SUBJECT_PROCESS" and (pattern is None or pattern.matches(provenance_node.label))
     elif query_node.type == "IP":
-        return provenance_node.type == "NetFlowObject"
+        return provenance_node.type == "NetFlowObject" and (pattern is None or pattern.matches(provenance_node.label))
 
-def main():
-    print("Initiating POIROT algorithm...")
-    if len(sys.argv) != 4:
-        print("python main.py <provenance graph file> <query graph file> <threshold>")
-        exit(1)
-    provenance_graph_file = sys.argv[1]
-    query_graph_file = sys.argv[2]
-    threshold = int(sys.argv[3])
+def compare_keys(query_node):
+    '''
+    (type, label) index keys of the provenance nodes that compare aligns query_node to
+    '''
+    pattern = label_index.parse_pattern(query_node.label)
+    if query_node.type == "FILE":
+        return [("FileObject", query_node.label if pattern is None else pattern)]
+    elif query_node.type == "PROCESS":
+        return [("SUBJECT_PROCESS", pattern)]
+    elif query_node.type == "IP":
+        return [("NetFlowObject", pattern)]
+    return []
 
-    provenance_graph = loaders.load_graph(provenance_graph_file)
-    query_graph = loaders.load_graph(query_graph_file)
-    candidate_alignments = poirot.find_candidate_node_alignments_with_custom_comparison(query_graph, provenance_graph, compare)
+compare.candidate_keys = compare_keys
 
+def print_alignment(provenance_graph, graph_alignment):
+    if hasattr(provenance_graph, "node_id"):
+        # compact (.pgraph) graphs use interned integer nodes, report the original IDs
+        print(f"Final node alignment: { {query_node: provenance_graph.node_id(node) for query_node, node in graph_alignment.items()} }")
+    else:
+        print(f"Final node alignment: {graph_alignment}")
+
+def detect(provenance_graph, query_graph, threshold, candidate_alignments, timings=None, scoring_workers=1, pruned=None,
+           time_window=None, time_respecting=False):
+    '''
+    runs steps 2 to 4 from each seed node in turn until an alignment scores at least 1/threshold
+    params: candidate_alignments -> step 1 result for query_graph
+            timings -> optional dict, seconds spent per step are added to it
+            scoring_workers -> number of processes scoring candidates in step 4
+            pruned -> optional (pruned graph, mapping) from pruning.prune, step 4
+            then runs on the pruned graph and the alignment is in its nodes
+            time_window, time_respecting -> optional temporal constraint on the
+            flows followed in steps 3 and 4, see temporal.neighbor_function
+    returns: (alerted, alignment, score) of the alerting alignment, or of the
+            last one scored (None, 0.0 if none could be scored)
+    '''
+    if timings is None:
+        timings = {}
+    scoring_graph, position = (provenance_graph, None) if pruned is None else pruned
+    graph_alignment, alignment_score = None, 0.0
+    if candidate_alignments.keys() != set(query_graph.nodes):
+        print("Couldn't find 1-1 matching of query to provenance graph.")
+        return False, graph_alignment, alignment_score
     for i in range(len(query_graph.nodes)):
-        seed_node = poirot.select_seed_node(candidate_alignments, i)
-        subset_candidate_alignments = poirot.search_expansion(candidate_alignments, seed_node, query_graph, provenance_graph, threshold)
+        with profiling.stage("search_expansion", timings):
+            seed_node = poirot.select_seed_node(candidate_alignments, i)
+            subset_candidate_alignments = poirot.search_expansion(candidate_alignments, seed_node, query_graph, provenance_graph, threshold,
+                                                                  time_window=time_window, time_respecting=time_respecting)
         if candidate_alignments.keys() != subset_candidate_alignments.keys() or any(len(candidates) == 0 for candidates in subset_candidate_alignments.values()):
             print("Couldn't find 1-1 matching of query to provenance graph.")
             continue
-        graph_alignment = poirot.find_graph_alignment(query_graph, provenance_graph, threshold, seed_node, subset_candidate_alignments)
-        print(f"Final node alignment: {graph_alignment}")
-        alignment_score = scores.compute_alignment_score(query_graph, provenance_graph,
-                                        graph_alignment, threshold)
+        subset_candidate_alignments = pruning.map_alignments(subset_candidate_alignments, position)
+        with profiling.stage("find_graph_alignment", timings):
+            graph_alignment = poirot.find_graph_alignment(query_graph, scoring_graph, threshold, seed_node,
+                                                         subset_candidate_alignments, scoring_workers,
+                                                         time_window, time_respecting)
+        print_alignment(scoring_graph, graph_alignment)
+        with profiling.stage("compute_alignment_score", timings):
+            alignment_score = scores.compute_alignment_score(query_graph, scoring_graph,
+                                            graph_alignment, threshold, time_window, time_respecting)
         print("Alignment score of the node alignment: {0:0.6f}".format(alignment_score))
         if alignment_score >= 1.0/float(threshold):
             print("Alert! Attacker may be present.")
-            return
+            return True, graph_alignment, alignment_score
         else:
             print("Could not find attacker, trying again with another seed node...")
-    print("Attacker may not be present in the system.")
+    return False, graph_alignment, alignment_score
+
+# state inherited by forked seed workers:
+# (provenance_graph, query_graph, threshold, candidate_alignments, pruned, time_window, time_respecting)
+_seed_state = None
+
+def silence_worker():
+    sys.stdout = open(os.devnull, "w")
+
+def explore_seed_in_worker(i):
+    '''
+    runs steps 2 to 4 from the i-th seed node
+    returns: (seed node, alignment or None if there is no 1-1 matching, score)
+    '''
+    provenance_graph, query_graph, threshold, candidate_alignments, pruned, time_window, time_respecting = _seed_state
+    scoring_graph, position = (provenance_graph, None) if pruned is None else pruned
+    seed_node = poirot.select_seed_node(candidate_alignments, i)
+    subset_candidate_alignments = poirot.search_expansion(candidate_alignments, seed_node, query_graph, provenance_graph, threshold,
+                                                          time_window=time_window, time_respecting=time_respecting)
+    if candidate_alignments.keys() != subset_candidate_alignments.keys() or any(len(candidates) == 0 for candidates in subset_candidate_alignments.values()):
+        return seed_node, None, 0.0
+    subset_candidate_alignments = pruning.map_alignments(subset_candidate_alignments, position)
+    graph_alignment = poirot.find_graph_alignment(query_graph, scoring_graph, threshold, seed_node, subset_candidate_alignments,
+                                                  time_window=time_window, time_respecting=time_respecting)
+    alignment_score = scores.compute_alignment_score(query_graph, scoring_graph, graph_alignment, threshold,
+                                                     time_window, time_respecting)
+    return seed_node, graph_alignment, alignment_score
+
+def detect_parallel(provenance_graph, query_graph, threshold, candidate_alignments, workers, pruned=None,
+                    time_window=None, time_respecting=False):
+    '''
+    like detect, but the seed nodes are tried concurrently by forked workers
+    that inherit the graph and its indexes; the remaining workers are
+    cancelled as soon as one alignment scores at least 1/threshold. The alert
+    reported is the first one found, which need not be that of the earliest seed.
+    returns: as detect
+    '''
+    global _seed_state
+    try:
+        context = multiprocessing.get_context("fork")
+    except ValueError:
+        return detect(provenance_graph, query_graph, threshold, candidate_alignments, pruned=pruned,
+                      time_window=time_window, time_respecting=time_respecting)
+    scoring_graph = provenance_graph if pruned is None else pruned[0]
+    graph_alignment, alignment_score = None, 0.0
+    if candidate_alignments.keys() != set(query_graph.nodes):
+        print("Couldn't find 1-1 matching of query to provenance graph.")
+        return False, graph_alignment, alignment_score
+    # build the read-only indexes once, before forking, so all workers share them
+    for graph in (provenance_graph, scoring_graph):
+        process_index.get_process_ancestor_index(graph)
+        process_index.get_process_ancestor_index(graph, reverse=True)
+    reachability.get_reachability_index(scoring_graph)
+    if time_window is not None or time_respecting:
+        for graph in (provenance_graph, scoring_graph):
+            temporal.get_temporal_index(graph)
+    _seed_state = (provenance_graph, query_graph, threshold, candidate_alignments, pruned, time_window, time_respecting)
+    try:
+        pool = context.Pool(workers, initializer=silence_worker)
+    finally:
+        _seed_state = None
+    try:
+        for seed_node, seed_alignment, seed_score in pool.imap_unordered(explore_seed_in_worker, range(len(query_graph.nodes))):
+            if seed_alignment is None:
+                print(f"Couldn't find 1-1 matching of query to provenance graph from seed node {seed_node}.")
+                continue
+            graph_alignment, alignment_score = seed_alignment, seed_score
+            print_alignment(scoring_graph, graph_alignment)
+            print("Alignment score of the node alignment from seed node {0}: {1:0.6f}".format(seed_node, alignment_score))
+            if alignment_score >= 1.0/float(threshold):
+                print("Alert! Attacker may be present.")
+                return True, graph_alignment, alignment_score
+    finally:
+        pool.terminate()
+        pool.join()
+    return False, graph_alignment, alignment_score
+
+def parse_options(args):
+    '''
+    separates the --quiet, --profile=<json file>, --cprofile=<file>,
+    --scoring-workers=<n>, --time-window=<start>,<end> and --time-respecting
+    options from the positional arguments; either end of the time window
+    may be left empty
+    returns: (positional arguments, options dict)
+    '''
+    positional = []
+    options = {"quiet": False, "profile": None, "cprofile": None, "scoring_workers": 1,
+               "time_window": None, "time_respecting": False}
+    for arg in args:
+        if arg == "--quiet":
+            options["quiet"] = True
+        elif arg.startswith("--profile="):
+            options["profile"] = arg[len("--profile="):]
+        elif arg.startswith("--cprofile="):
+            options["cprofile"] = arg[len("--cprofile="):]
+        elif arg.startswith("--scoring-workers="):
+            options["scoring_workers"] = int(arg[len("--scoring-workers="):])
+        elif arg.startswith("--time-window="):
+            ends = arg[len("--time-window="):].split(",")
+            times = tuple(temporal.to_time(end) for end in ends)
+            if len(ends) != 2 or any(time is None and end.strip() != "" for end, time in zip(ends, times)):
+                raise ValueError(f"invalid time window {arg}, expected --time-window=<start>,<end>")
+            options["time_window"] = times
+        elif arg == "--time-respecting":
+            options["time_respecting"] = True
+        else:
+            positional.append(arg)
+    return positional, options
+
+def main():
+    args, options = parse_options(sys.argv[1:])
+    profiling.profiler.quiet = options["quiet"]
+    profiling.profiler.enabled = options["profile"] is not None
+    print("Initiating POIROT algorithm...")
+    if len(args) not in (3, 4):
+        print("python main.py <provenance graph file> <query graph file> <threshold> [workers] "
+              "[--quiet] [--profile=<json file>] [--cprofile=<file>] [--scoring-workers=<n>] "
+              "[--time-window=<start>,<end>] [--time-respecting]")
+        exit(1)
+    provenance_graph_file = args[0]
+    query_graph_file = args[1]
+    threshold = int(args[2])
+    workers = int(args[3]) if len(args) == 4 else 1
+
+    if options["cprofile"] is not None:
+        cprofile = profiling.profiler.cprofile(options["cprofile"])
+    else:
+        cprofile = contextlib.nullcontext()
+    with cprofile:
+        with profiling.stage("load_graphs"):
+            provenance_graph = loaders.load_graph(provenance_graph_file)
+            query_graph = loaders.load_graph(query_graph_file)
+        with profiling.stage("find_candidate_node_alignments"):
+            candidate_alignments = poirot.find_candidate_node_alignments_with_custom_comparison(query_graph, provenance_graph, compare)
+
+        # step 4 only needs the part of the graph between candidates
+        with profiling.stage("prune"):
+            pruned_graph, position, stats = pruning.prune(provenance_graph, query_graph, candidate_alignments)
+        print("Pruned provenance graph to {nodes_after}/{nodes_before} nodes and {edges_after}/{edges_before} edges "
+              "({removed_fraction:.1%} of nodes removed) in {seconds:.2f}s".format(**stats))
+
+        if workers > 1:
+            # seed workers are daemonic and cannot fork scoring workers of their own
+            alerted, _, _ = detect_parallel(provenance_graph, query_graph, threshold, candidate_alignments, workers,
+                                            pruned=(pruned_graph, position), time_window=options["time_window"],
+                                            time_respecting=options["time_respecting"])
+        else:
+            alerted, _, _ = detect(provenance_graph, query_graph, threshold, candidate_alignments,
+                                   scoring_workers=options["scoring_workers"], pruned=(pruned_graph, position),
+                                   time_window=options["time_window"], time_respecting=options["time_respecting"])
+    if not alerted:
+        print("Attacker may not be present in the system.")
+    if options["profile"] is not None:
+        # counters of forked workers (workers > 1) are not collected
+        profiling.profiler.export_json(options["profile"], {
+            "pruning": stats, "influence_cache": influence_cache.get_influence_cache(pruned_graph).stats()})
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
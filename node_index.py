@@ -0,0 +1,81 @@
+# Index of provenance nodes by type and by (type, label).
+# Candidate node alignment (poirot step 1) looks candidates up here instead of
+# calling the comparison function for every (query node, provenance node) pair.
+# Lookups return node positions in graph.nodes order, so the candidates come
+# out in the same order as a full scan. The label index of a type is only built
+# the first time a label of that type is looked up. A label may also be a
+# label_index.LabelPattern (glob, CIDR or regex), resolved by a per-type
+# label_index.PatternIndex.
+
+import heapq
+import graph_indexes
+import label_index
+
+class NodeIndex:
+    def __init__(self, graph):
+        if hasattr(graph, "type_codes"):
+            # compact graphs: nodes are their own positions, types are columns
+            self.nodes = None
+            self.types = [graph.type_names[code] for code in graph.type_codes.tolist()]
+            self._label_columns = (graph.label_offsets, graph.label_data)
+            self._labels = None
+        else:
+            self.nodes = list(graph.nodes)
+            node_objects = [graph.nodes[node]['node'] for node in self.nodes]
+            self.types = [node.type for node in node_objects]
+            self._labels = [node.label for node in node_objects]
+        self.by_type = {}
+        for position, node_type in enumerate(self.types):
+            self.by_type.setdefault(node_type, []).append(position)
+        self.by_label = {}
+        self.pattern_indexes = {}
+
+    def label(self, position):
+        if self._labels is not None:
+            return self._labels[position]
+        offsets, data = self._label_columns
+        return data[offsets[position]:offsets[position + 1]].tobytes().decode('utf-8')
+
+    def label_positions(self, node_type):
+        '''
+        returns: {label: [positions]} for the nodes of node_type
+        '''
+        if node_type not in self.by_label:
+            labels = {}
+            for position in self.by_type.get(node_type, []):
+                labels.setdefault(self.label(position), []).append(position)
+            self.by_label[node_type] = labels
+        return self.by_label[node_type]
+
+    def pattern_index(self, node_type):
+        if node_type not in self.pattern_indexes:
+            self.pattern_indexes[node_type] = label_index.PatternIndex(self.label_positions(node_type))
+        return self.pattern_indexes[node_type]
+
+    def positions(self, node_type, label=None):
+        if label is None:
+            return self.by_type.get(node_type, [])
+        if isinstance(label, label_index.LabelPattern):
+            return self.pattern_index(node_type).positions(label)
+        return self.label_positions(node_type).get(label, [])
+
+    def lookup(self, keys):
+        '''
+        params: keys: list of (type, label) pairs, label None matches any label
+                and a label_index.LabelPattern matches the labels it describes
+        returns: the nodes matching any key, without duplicates, in graph order
+        '''
+        position_lists = [self.positions(node_type, label) for node_type, label in keys]
+        if len(position_lists) == 1:
+            positions = position_lists[0]
+        else:
+            positions = []
+            for position in heapq.merge(*position_lists):
+                if not positions or positions[-1] != position:
+                    positions.append(position)
+        if self.nodes is None:
+            return list(positions)
+        return [self.nodes[position] for position in positions]
+
+def get_node_index(graph):
+    return graph_indexes.get_index(graph, "nodes", NodeIndex)
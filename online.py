@@ -0,0 +1,221 @@
+# Online (incremental) POIROT detection over a growing provenance graph.
+# Instead of re-running the four steps on the whole graph every few minutes,
+# OnlineDetector keeps their state between batches of new edges:
+#   step 1: only the new provenance nodes are compared against the query nodes,
+#           and matches are appended to the candidate lists
+#   step 3: one expansion (poirot.Expansion) is kept per seed node, and it is
+#           only recomputed when the seed node gets new candidates or a new
+#           edge touches a node it reached (an endpoint, or a process whose
+#           process ancestors or descendants the edge changes), so it is
+#           always the expansion a fresh run would compute
+#   step 4: cached influence scores are kept, except those of pairs whose end
+#           node is reachable from a new edge (a new edge u -> v can only add
+#           flows into, or change the process ancestors of, nodes reachable
+#           from v); the alignment is recomputed only when the expansion or
+#           the cache changed, so unchanged pairs are never scored again
+# The process-ancestor and reachability indexes are updated in place.
+# As in main.detect, the seed nodes are tried in order until one alignment
+# scores at least 1/threshold, and an alert is emitted when that happens.
+#
+# usage: python online.py <provenance graph file> <query graph file> <threshold> [batch size] [--scoring-workers=<n>]
+#        [--time-window=<start>,<end>] [--time-respecting]
+# new edges are read from stdin in the text format ("TYPE:label -> TYPE:label").
+
+import sys
+import graph_indexes
+import influence_cache
+import loaders
+import main
+import poirot
+import process_index
+import reachability
+import scores
+import traversal
+
+class OnlineDetector:
+    '''
+    params: provenance_graph -> networkx DiGraph, edges are added to it in place
+            query_graph -> networkx DiGraph representing query graph
+            threshold -> upper bound for number of distinct compromises attacker can reasonably exploit
+            comparison_function -> as in poirot.find_candidate_node_alignments_with_custom_comparison
+            workers -> number of processes scoring candidates in find_graph_alignment
+            time_window, time_respecting -> optional temporal constraint, as in main.detect
+    '''
+    def __init__(self, provenance_graph, query_graph, threshold, comparison_function=main.compare, workers=1,
+                 time_window=None, time_respecting=False):
+        if not hasattr(provenance_graph, "add_edge"):
+            raise TypeError("online detection needs a mutable networkx provenance graph")
+        self.provenance_graph = provenance_graph
+        self.query_graph = query_graph
+        self.threshold = threshold
+        self.comparison_function = comparison_function
+        self.workers = workers
+        self.time_window = time_window
+        self.time_respecting = time_respecting
+        found = poirot.find_candidate_node_alignments_with_custom_comparison(query_graph, provenance_graph, comparison_function)
+        self.candidate_alignments = {query_node: found.get(query_node, []) for query_node in query_graph.nodes}
+        # seed query node -> {"expansion", "subset_candidate_alignments", "alignment", "score"}
+        self.seeds = {}
+        self.seed_node = None
+        self.alignment = None
+        self.score = 0.0
+        self.alerted = False
+        self.update()
+
+    def add_edges(self, edges):
+        '''
+        params: edges -> list of (from Node, to Node) pairs to add to the provenance graph
+        returns: an alert dict ({"alignment", "score"}) if the alignment score
+                crossed 1/threshold with this batch, else None
+        '''
+        graph = self.provenance_graph
+        cache = influence_cache.get_influence_cache(graph)
+        new_nodes = []
+        new_edges = []
+        for from_node, to_node in edges:
+            for node in (from_node, to_node):
+                if node.id not in graph:
+                    new_nodes.append(node.id)
+                graph.add_node(node.id, node=node)
+            if not graph.has_edge(from_node.id, to_node.id):
+                graph.add_edge(from_node.id, to_node.id)
+                new_edges.append((from_node.id, to_node.id))
+        if not new_nodes and not new_edges:
+            return None
+
+        # the influence cache and the process-ancestor and reachability indexes
+        # are kept and updated, other indexes (node lookups) are rebuilt lazily
+        graph_indexes.retain(graph, ["influence_scores", "process_ancestors", "process_descendants", "reachability"])
+        process_index.update_indexes(graph, new_nodes, new_edges)
+        reachability.update_index(graph, new_nodes, new_edges)
+        affected = set()
+        for _, target in new_edges:
+            traversal.dfs(graph, target, visited=affected)
+        dropped = cache.invalidate_targets(affected)
+
+        new_candidates = {}
+        for query_node_id in self.query_graph.nodes:
+            query_node = self.query_graph.nodes[query_node_id]['node']
+            matches = [node for node in new_nodes if self.comparison_function(query_node, graph.nodes[node]['node'])]
+            if matches:
+                self.candidate_alignments[query_node_id].extend(matches)
+                new_candidates[query_node_id] = matches
+
+        touched = self.touched_nodes(new_edges)
+        for seed_node, seed in self.seeds.items():
+            expansion = seed["expansion"]
+            if expansion is not None and (seed_node in new_candidates or not touched.isdisjoint(expansion.all_nodes_visited)):
+                seed["expansion"] = None
+        print(f"Added {len(new_edges)} edges ({len(new_nodes)} new nodes), {dropped} cached influence scores invalidated")
+        return self.update(dropped > 0)
+
+    def touched_nodes(self, edges):
+        '''
+        returns: the nodes at which a step 3 traversal can behave differently
+                because of the new edges: their endpoints, and for edges between
+                two processes, the processes whose process ancestors (below the
+                edge) or descendants (above it) change
+        '''
+        graph = self.provenance_graph
+
+        def is_process(node):
+            return scores.is_process(graph, node)
+        touched = set()
+        for source, target in edges:
+            touched.update((source, target))
+            if is_process(source) and is_process(target):
+                touched |= traversal.dfs(graph, target, predicate=is_process)
+                touched |= traversal.dfs(graph, source, "reverse", predicate=is_process)
+        return touched
+
+    def update(self, scores_changed=False):
+        '''
+        re-aligns the query graph from each seed node in turn, until one
+        alignment raises an alert; a seed is only re-aligned if its candidates
+        or the cached scores changed
+        returns: an alert dict if the score crossed 1/threshold, else None
+        '''
+        if any(len(candidates) == 0 for candidates in self.candidate_alignments.values()):
+            return None
+        alert = False
+        # as main.detect, report the alerting alignment or the last one scored
+        self.seed_node, self.alignment, self.score = None, None, 0.0
+        for i in range(len(self.query_graph.nodes)):
+            seed_node = poirot.select_seed_node(self.candidate_alignments, i)
+            seed = self.seeds.setdefault(seed_node, {"expansion": None, "subset_candidate_alignments": None,
+                                                     "alignment": None, "score": 0.0})
+            if seed["expansion"] is None:
+                seed["expansion"] = poirot.Expansion(self.candidate_alignments, self.query_graph,
+                                                     self.provenance_graph, self.threshold,
+                                                     self.time_window, self.time_respecting)
+                seed["expansion"].expand(self.candidate_alignments[seed_node])
+            self.align(seed_node, seed, scores_changed)
+            if seed["alignment"] is not None:
+                self.seed_node, self.alignment, self.score = seed_node, seed["alignment"], seed["score"]
+            if seed["score"] >= 1.0/float(self.threshold):
+                alert = True
+                break
+        crossed = alert and not self.alerted
+        self.alerted = alert
+        if crossed:
+            return {"alignment": dict(self.alignment), "score": self.score}
+        return None
+
+    def align(self, seed_node, seed, scores_changed):
+        '''
+        runs step 4 for one seed node if its expansion or the cached scores changed
+        '''
+        subset_candidate_alignments = seed["expansion"].alignments()
+        if subset_candidate_alignments == seed["subset_candidate_alignments"] and not scores_changed:
+            return
+        seed["subset_candidate_alignments"] = subset_candidate_alignments
+        if subset_candidate_alignments.keys() != self.candidate_alignments.keys():
+            seed["alignment"], seed["score"] = None, 0.0
+            return
+        seed["alignment"] = poirot.find_graph_alignment(self.query_graph, self.provenance_graph, self.threshold,
+                                                        seed_node, subset_candidate_alignments, self.workers,
+                                                        self.time_window, self.time_respecting)
+        seed["score"] = scores.compute_alignment_score(self.query_graph, self.provenance_graph,
+                                                       seed["alignment"], self.threshold,
+                                                       self.time_window, self.time_respecting)
+        print("Alignment score of the node alignment from seed node {0}: {1:0.6f}".format(seed_node, seed["score"]))
+
+def read_edge_batches(lines, batch_size):
+    '''
+    groups "TYPE:label -> TYPE:label" lines into lists of at most batch_size edges
+    '''
+    batch = []
+    for line in lines:
+        if "->" not in line:
+            continue
+        batch.append(loaders.parse_txt_edge(line))
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def run():
+    print("Initiating online POIROT detection...")
+    args, options = main.parse_options(sys.argv[1:])
+    if len(args) not in (3, 4):
+        print("python online.py <provenance graph file> <query graph file> <threshold> [batch size] [--scoring-workers=<n>] "
+              "[--time-window=<start>,<end>] [--time-respecting]")
+        exit(1)
+    provenance_graph = loaders.load_graph(args[0])
+    query_graph = loaders.load_graph(args[1])
+    threshold = int(args[2])
+    batch_size = int(args[3]) if len(args) == 4 else 1
+
+    detector = OnlineDetector(provenance_graph, query_graph, threshold, workers=options["scoring_workers"],
+                              time_window=options["time_window"], time_respecting=options["time_respecting"])
+    if detector.alerted:
+        print(f"Alert! Attacker may be present. Node alignment: {detector.alignment}")
+    for batch in read_edge_batches(sys.stdin, batch_size):
+        alert = detector.add_edges(batch)
+        if alert is not None:
+            print(f"Alert! Attacker may be present. Node alignment: {alert['alignment']}")
+            sys.stdout.flush()
+
+if __name__ == "__main__":
+    run()
@@ -1,11 +1,11 @@
-import networkx as nx
 import pandas as pd
 import gzip
 import gdown
 import json
 import os
 import pickle
-from node import Node
+import compact_graph
+import graph_builder
 
 def preprocess(data):
     new_data = {}
@@ -78,36 +78,38 @@ def extract_logs(filepath, givenID):
         out.writelines(logs)
 
 
-def generate_networkx_graph():
+def host_name(givenID):
+    return f"SysClient{givenID}.systemia.com"
+
+
+def dedup_key(x):
     """
-    This function converts the logs in "raw_logs/logs.txt" to a networkx graph.
+    Returns the key preprocess deduplicates a labelled event on, or None when
+    preprocess drops the event.
+    """
+    if x['object'] not in ['PROCESS','FILE','FLOW','MODULE']:
+        return None
+    if x['action'] in ['START','TERMINATE'] or x['subjectname'] == x['objectname']:
+        return None
+    return (x['action'],x['subjectname'],x['objectname'])
+
+
+def records_to_graph(filtered):
+    """
+    Builds the networkx graph of a list of preprocessed events.
 
     Returns:
-        G (networkx.Graph): The networkx graph representing the logs.
+        G (networkx.Graph): The networkx graph representing the events.
+        df (pandas.DataFrame): The events as an edge table.
     """
-    path_to_host_dataset = "raw_logs/logs.txt"
-    with open(path_to_host_dataset, 'r') as f:
-        json_records = [json.loads(line) for line in f]
-    
-    lbldta = [get_labels(x) for x in json_records]
-    lbldta = [x for x in lbldta if x != None]
-    filtered = preprocess(lbldta)
-    
     df = pd.DataFrame.from_dict(filtered)
     df['subject_type'] = 'PROCESS' 
     df = df.rename(columns={'object': 'object_type','action': 'syscall'})
     
     df = df[['subjectname','subject_type','objectname','object_type','syscall','timestamp']]
 
-    G = nx.DiGraph()
+    G = graph_builder.build_graph(df)
 
-    for _, row in df.iterrows():
-        node1 = Node(row['subjectname'], row['subject_type'], row['subjectname'])
-        G.add_node(node1.id, node=node1)
-        node2 = Node(row['objectname'], row['object_type'], row['objectname'])
-        G.add_node(node2.id, node=node2)
-        G.add_edge(node1.id, node2.id)
-    
     return G, df
 
     # edges = df[['subjectname', 'objectname']].values.tolist()
@@ -118,9 +120,75 @@ def generate_networkx_graph():
     # return G, df
 
 
+def generate_networkx_graph():
+    """
+    This function converts the logs in "raw_logs/logs.txt" to a networkx graph.
+
+    Returns:
+        G (networkx.Graph): The networkx graph representing the logs.
+    """
+    path_to_host_dataset = "raw_logs/logs.txt"
+    with open(path_to_host_dataset, 'r') as f:
+        json_records = [json.loads(line) for line in f]
+    
+    lbldta = [get_labels(x) for x in json_records]
+    lbldta = [x for x in lbldta if x != None]
+    filtered = preprocess(lbldta)
+    
+    return records_to_graph(filtered)
+
+
+def generate_host_graphs(filepaths, output_dir, hosts=None, extension=".pkl"):
+    """
+    Builds the graphs of every host in one streaming pass over the optc files.
+    Events are routed by hostname, labelled with get_labels and deduplicated
+    per host exactly as preprocess does (last event of each key wins), so no
+    file is decompressed more than once and no raw_logs dump is written.
+    Only the columns of the edge table are kept per event.
+
+    Args:
+        filepaths (list): The optc .ecar.json.gz files.
+        output_dir (str): Directory the graphs are written to, one
+            "<hostname><extension>" file per host.
+        hosts (list): Optional host IDs (e.g. "0101") to keep, all hosts by default.
+        extension (str): ".pkl", or ".pgraph" for memory-mappable graphs.
+
+    Returns:
+        dict: hostname -> path of the saved graph
+    """
+    if isinstance(filepaths, str):
+        filepaths = [filepaths]
+    wanted = None if hosts is None else {host_name(givenID) for givenID in hosts}
+    columns = ('subjectname','objectname','object','action','timestamp')
+
+    host_events = {}
+    for filepath in filepaths:
+        with gzip.open(filepath, 'r') as fin:
+            for line in fin:
+                text = json.loads(line)
+                hostID = text['hostname']
+                if wanted is not None and hostID not in wanted:
+                    continue
+                event = get_labels(text)
+                if event is None:
+                    continue
+                key = dedup_key(event)
+                if key is not None:
+                    host_events.setdefault(hostID, {})[key] = {column: event.get(column) for column in columns}
+
+    os.makedirs(output_dir, exist_ok=True)
+    saved = {}
+    for hostID, events in host_events.items():
+        G, _ = records_to_graph(list(events.values()))
+        saved[hostID] = os.path.join(output_dir, hostID + extension)
+        save_graph_to_disk(G, saved[hostID])
+    return saved
+
+
 def save_graph_to_disk(graph, filepath):
     """
-    Save the NetworkX graph to disk in GPickle format.
+    Save the NetworkX graph to disk in GPickle format, or as a memory-mappable
+    .pgraph directory when filepath ends in ".pgraph".
 
     Args:
         graph (networkx.Graph): The NetworkX graph to be saved.
@@ -129,6 +197,11 @@ def save_graph_to_disk(graph, filepath):
     Returns:
         None
     """
+    if filepath.rstrip("/").endswith(".pgraph"):
+        if not isinstance(graph, compact_graph.CompactGraph):
+            graph = compact_graph.from_networkx(graph)
+        compact_graph.save(graph, filepath.rstrip("/"))
+        return
     with open(filepath, "wb") as f:
         pickle.dump(graph, f)
 
@@ -141,8 +214,11 @@ def load_graph_from_disk(filepath):
         filepath (str): The path to the graph file.
 
     Returns:
-        G (networkx.Graph): The loaded NetworkX graph.
+        G (networkx.Graph): The loaded NetworkX graph (a memory-mapped
+        CompactGraph for a ".pgraph" directory).
     """
+    if filepath.rstrip("/").endswith(".pgraph"):
+        return compact_graph.load(filepath.rstrip("/"))
     with open(filepath, "rb") as f:
         graph = pickle.load(f)
     return graph
@@ -156,6 +232,9 @@ def main():
     # Extracting Logs
     # extract_logs("data/AIA-101-125.ecar-2019-12-07T02-20-06.258.json.gz", "0101")
     
+    # Constructing the graphs of all hosts in one pass
+    # generate_host_graphs(["data/AIA-101-125.ecar-2019-12-07T02-20-06.258.json.gz"], "graphs")
+
     # Constructing Graph
     G,_ = generate_networkx_graph()
     save_graph_to_disk(G, "networkx_graph.pkl")
@@ -1,5 +1,13 @@
+import itertools
+import multiprocessing
 import scores
 import helpers
+import influence_cache
+import node_index
+import process_index
+import profiling
+import reachability
+import temporal
 
 # step 1
 def find_candidate_node_alignments(query_graph, provenance_graph):
@@ -16,19 +24,11 @@ def find_candidate_node_alignments(query_graph, provenance_graph):
             node_alignments is the list of nodes from the provenance graph
             that are aligned to nodes in the query graph
     ''' 
-    query_types = {}
+    index = node_index.get_node_index(provenance_graph)
+    candidate_alignments = {}
     for query_node_id in query_graph.nodes:
-        query_node = query_graph.nodes[query_node_id]['node']
-        query_node_type = query_node.type
-        query_types[query_node_type] = query_types.get(query_node_type, []) + [query_node_id]
-    
-    candidate_alignments = {query_node_id: [] for query_node_id in query_graph.nodes}
-    for provenance_node_id in provenance_graph.nodes:
-        provenance_node = provenance_graph.nodes[provenance_node_id]['node']
-        provenance_node_type = provenance_node.type
-        if provenance_node_type in query_types:
-            for query_node_id in query_types[provenance_node_type]:
-                candidate_alignments[query_node_id] = candidate_alignments.get(query_node_id, []) + [provenance_node_id]
+        query_node_type = query_graph.nodes[query_node_id]['node'].type
+        candidate_alignments[query_node_id] = index.lookup([(query_node_type, None)])
 
     return candidate_alignments
 
@@ -41,7 +41,10 @@ def find_candidate_node_alignments_with_custom_comparison(query_graph, provenanc
     params: query_graph -> networkx DiGraph representing query graph
             provenance_graph -> networkx DiGraph representing provenance graph
             comparison_function -> function that takes two Nodes as argument and returns true if they "align"
-            and returns false if they don't
+            and returns false if they don't. It may carry a candidate_keys attribute, a function
+            that takes the query Node and returns the (type, label) pairs (label None for any label)
+            of exactly the provenance nodes it aligns to, or None if it cannot tell; candidates are
+            then looked up in an index of the provenance graph instead of comparing every node
     returns: a dictionary like:
             {node_id : [node_alignments] where
             node_id is the node from query graph
@@ -50,14 +53,25 @@ def find_candidate_node_alignments_with_custom_comparison(query_graph, provenanc
     ''' 
     candidate_alignments = {}
     for query_node_id in query_graph.nodes:
-        query_node = query_graph.nodes[query_node_id]['node']
-        for provenance_node_id in provenance_graph.nodes:
-            provenance_node = provenance_graph.nodes[provenance_node_id]['node']
-            if comparison_function(query_node, provenance_node):
-                candidate_alignments[query_node_id] = candidate_alignments.get(query_node_id, []) + [provenance_node_id]
+        candidates = find_candidates(query_graph.nodes[query_node_id]['node'], provenance_graph, comparison_function)
+        if len(candidates) > 0:
+            candidate_alignments[query_node_id] = candidates
     
     return candidate_alignments
 
+def find_candidates(query_node, provenance_graph, comparison_function):
+    '''
+    params: query_node -> Node of the query graph
+            provenance_graph, comparison_function -> as in find_candidate_node_alignments_with_custom_comparison
+    returns: the provenance nodes aligned to query_node, in graph order
+    '''
+    candidate_keys = getattr(comparison_function, "candidate_keys", None)
+    keys = None if candidate_keys is None else candidate_keys(query_node)
+    if keys is not None:
+        return node_index.get_node_index(provenance_graph).lookup(keys)
+    return [provenance_node_id for provenance_node_id in provenance_graph.nodes
+            if comparison_function(query_node, provenance_graph.nodes[provenance_node_id]['node'])]
+
 # step 2
 def select_seed_node(candidate_alignments, index):
     '''
@@ -73,7 +87,95 @@ def select_seed_node(candidate_alignments, index):
     return sorted_node_alignments[-1]
 
 # step 3
-def search_expansion(candidate_alignments, seed_node, query_graph, provenance_graph, threshold):
+class Expansion:
+    '''
+    state of a step 3 expansion: the nodes reached so far forward and backward
+    and the query nodes that still have no reached candidate. Each round runs
+    a threshold-bounded forward and backward dfs from every node of the
+    frontier, i.e. the start nodes and then the nodes first reached in the
+    previous round that still have unreached neighbors. Every dfs has visited
+    state of its own: with shared state, a node first reached by an expensive
+    path would block a cheaper path from another source. Nodes reached in
+    earlier rounds are not searched from again, their dfs would be the same.
+    The expansion is kept as an object so that online.py can tell from
+    all_nodes_visited whether new edges can change it.
+    params: candidate_alignments -> candidate alignments from nodes in G_q to nodes in G_p
+            query_graph, provenance_graph, threshold, time_window, time_respecting -> as in search_expansion
+    '''
+    def __init__(self, candidate_alignments, query_graph, provenance_graph, threshold,
+                 time_window=None, time_respecting=False):
+        self.candidate_alignments = candidate_alignments
+        self.provenance_graph = provenance_graph
+        self.threshold = threshold
+        self.forward_steps = temporal.neighbor_function(provenance_graph, "forward", time_window, time_respecting)
+        self.backward_steps = temporal.neighbor_function(provenance_graph, "reverse", time_window, time_respecting)
+        # time-respecting traversals revisit nodes reached with a better bound
+        self.time_respecting = time_respecting
+        # provenance node -> query nodes it is a candidate alignment of
+        self.candidate_query_nodes = {}
+        for query_node, candidates in candidate_alignments.items():
+            for candidate in candidates:
+                self.candidate_query_nodes.setdefault(candidate, []).append(query_node)
+        self.all_nodes_visited = set()
+        self.query_nodes_to_visit = set(query_graph.nodes)
+
+    def expand(self, start_nodes, count_threshold=20, stats=None):
+        '''
+        runs expansion rounds from start_nodes
+        params: start_nodes -> provenance nodes the first round expands from
+                count_threshold -> maximum number of rounds
+                stats -> optional list, one dict of statistics is appended per round
+        returns: the nodes reached by these rounds
+        '''
+        provenance_graph = self.provenance_graph
+        forward_steps = self.forward_steps
+        backward_steps = self.backward_steps
+        all_nodes_visited = self.all_nodes_visited
+        frontier = list(dict.fromkeys(start_nodes))
+        all_reached = []
+        count = 0
+        while len(self.query_nodes_to_visit) > 0 and len(frontier) > 0 and count < count_threshold:
+            count += 1
+            reached = []
+            for node in frontier:
+                for direction, steps in (("forward", forward_steps), ("reverse", backward_steps)):
+                    visited = set()
+                    helpers.do_dfs(provenance_graph, node, visited, self.threshold, direction, steps,
+                                   {} if self.time_respecting else None)
+                    for visited_node in visited:
+                        if visited_node not in all_nodes_visited:
+                            all_nodes_visited.add(visited_node)
+                            reached.append(visited_node)
+            for node in reached:
+                for query_node in self.candidate_query_nodes.get(node, []):
+                    self.query_nodes_to_visit.discard(query_node)
+            all_reached.extend(reached)
+            profiling.count("nodes_visited", len(reached))
+            frontier = [node for node in reached
+                        if any(neighbor not in all_nodes_visited for neighbor, _ in forward_steps(node, None))
+                        or any(neighbor not in all_nodes_visited for neighbor, _ in backward_steps(node, None))]
+            round_stats = {"round": count, "reached": len(reached),
+                           "visited": len(all_nodes_visited), "frontier": len(frontier),
+                           "query_nodes_left": len(self.query_nodes_to_visit)}
+            if stats is not None:
+                stats.append(round_stats)
+            profiling.log("Expansion round {round}: reached {reached} nodes ({visited} visited), frontier {frontier}, {query_nodes_left} query nodes left".format(**round_stats))
+        return all_reached
+
+    def alignments(self):
+        '''
+        returns: the candidate alignments restricted to reached nodes, query
+                nodes without any reached candidate are left out
+        '''
+        new_candidate_alignments = {}
+        for query_node_alignment, candidates in self.candidate_alignments.items():
+            intersection = [candidate for candidate in candidates if candidate in self.all_nodes_visited]
+            if len(intersection) > 0:
+                new_candidate_alignments[query_node_alignment] = intersection
+        return new_candidate_alignments
+
+def search_expansion(candidate_alignments, seed_node, query_graph, provenance_graph, threshold, stats=None,
+                     time_window=None, time_respecting=False):
     '''
     params: 
             candidate_alignments -> candidate alignments from nodes in G_q to nodes in G_p
@@ -82,52 +184,115 @@ def search_expansion(candidate_alignments, seed_node, query_graph, provenance_gr
             query_graph -> networkx DiGraph representing query graph
             provenance_graph -> networkx DiGraph representing provenance graph
             threshold -> upper bound for number of distinct compromises attacker can reasonably exploit
+            stats -> optional list, one dict of statistics is appended per expansion round
+            time_window -> optional (start, end), only edges with a timestamp in it are followed
+            time_respecting -> only follow flows whose edge timestamps do not go backwards in time
     result: {node_id : [subset_node_alignments]} where node_id is the
             node from query graph.
             subset_node_alignments is the list of node alignments
             which are reachable from *seed node alignments* using a
             backward/forward search (this refines the original list of candidate alignments)
     '''
-    reverse_provenance_graph = provenance_graph.reverse()
-
-    # do forward and backward traversal
-    all_nodes_visited = set()
-    all_nodes = set(provenance_graph.nodes)
-    query_nodes_to_visit = set(query_graph.nodes)
-    start_nodes = candidate_alignments[seed_node]
-    count_threshold = 20
-    count = 0
-    new_candidate_alignments = {}
-    while len(query_nodes_to_visit) > 0 and count < count_threshold:
-        count += 1
-        for node in start_nodes:
-            visited = set()
-            helpers.do_dfs(provenance_graph, node, visited, threshold)
-            backward_visited = set()
-            helpers.do_dfs(reverse_provenance_graph, node, backward_visited, threshold)
-            all_nodes_visited = all_nodes_visited.union(visited, backward_visited) 
-        for query_node_alignment in candidate_alignments:
-            intersection = list(set(candidate_alignments[query_node_alignment]).intersection(all_nodes_visited))
-            if len(intersection) > 0:
-                query_nodes_to_visit.discard(query_node_alignment)
-                new_candidate_alignments[query_node_alignment] = new_candidate_alignments.get(query_node_alignment, []) + intersection
-        if len(query_nodes_to_visit) > 0:
-            # set start nodes to nodes adjacent to unvisited nodes but that have been visited in a previous traversal
-            unvisited = all_nodes.difference(all_nodes_visited)
-            start_nodes = []
-            for node in unvisited:
-                forward_neighbors = set(provenance_graph[node])
-                reverse_neighbors = set(reverse_provenance_graph[node])
-                neighbors = forward_neighbors.union(reverse_neighbors)
-                visited_neighbors = neighbors.intersection(all_nodes_visited)
-                start_nodes.extend(visited_neighbors)
-    print("Printing candidate node alignment lengths: ")
+    expansion = Expansion(candidate_alignments, query_graph, provenance_graph, threshold,
+                          time_window, time_respecting)
+    expansion.expand(candidate_alignments[seed_node], stats=stats)
+    new_candidate_alignments = expansion.alignments()
+    profiling.log("Printing candidate node alignment lengths: ")
     for node_alignment in new_candidate_alignments:
-        print("{}: {}".format(node_alignment, len(new_candidate_alignments[node_alignment])))
+        profiling.log("{}: {}".format(node_alignment, len(new_candidate_alignments[node_alignment])))
     return new_candidate_alignments
 
 # step 4
-def find_graph_alignment(query_graph, provenance_graph, threshold, seed_node, candidate_alignments):
+def score_candidate(candidate_alignment, outgoing_flows, incoming_flows, aligned_nodes, candidate_alignments, threshold, provenance_graph,
+                    time_window=None, time_respecting=False):
+    '''
+    params: 
+            candidate_alignment -> candidate node in G_p for the query node being aligned
+            outgoing_flows, incoming_flows -> query nodes reachable from / reaching the query node
+            aligned_nodes -> query nodes aligned so far
+            candidate_alignments -> candidate alignments from nodes in G_q to nodes in G_p
+            threshold -> upper bound for number of distinct compromises attacker can reasonably exploit
+            provenance_graph -> networkx DiGraph representing provenance graph
+            time_window, time_respecting -> optional temporal constraint on the flows, see scores.find_best_flow
+    result: sum of the best influence scores of the candidate towards every outgoing and incoming flow
+    '''
+    out_final_influence_score = 0
+    in_final_influence_score = 0
+
+    for outgoing_flow in outgoing_flows:
+        if outgoing_flow not in aligned_nodes:
+            influence_scores = [0]
+            # candidates the flow cannot reach score 0, skip them up front
+            candidate_outgoing_alignments = reachability.filter_reachable(provenance_graph, candidate_alignment, candidate_alignments[outgoing_flow])
+            for candidate_outgoing_alignment in candidate_outgoing_alignments:
+                influence_score = scores.compute_influence_score(candidate_alignment, candidate_outgoing_alignment, threshold, provenance_graph,
+                                                                 time_window, time_respecting)
+                influence_scores.append(influence_score)
+            out_final_influence_score += max(influence_scores)
+        else:
+            out_final_influence_score += scores.compute_influence_score(candidate_alignment, aligned_nodes[outgoing_flow], threshold, provenance_graph,
+                                                                        time_window, time_respecting)
+    
+    for incoming_flow in incoming_flows:
+        if incoming_flow not in aligned_nodes:
+            influence_scores = [0]
+            candidate_incoming_alignments = reachability.filter_reaching(provenance_graph, candidate_alignments[incoming_flow], candidate_alignment)
+            for candidate_incoming_alignment in candidate_incoming_alignments:
+                influence_score = scores.compute_influence_score(candidate_incoming_alignment, candidate_alignment, threshold, provenance_graph,
+                                                                 time_window, time_respecting)
+                influence_scores.append(influence_score)
+            in_final_influence_score += max(influence_scores)
+        else:
+            in_final_influence_score += scores.compute_influence_score(aligned_nodes[incoming_flow], candidate_alignment, threshold, provenance_graph,
+                                                                       time_window, time_respecting)
+    
+    return out_final_influence_score + in_final_influence_score
+
+# state inherited by forked scoring workers: (provenance_graph, candidate_alignments, threshold, time_window, time_respecting)
+_worker_state = None
+
+def score_candidates_in_worker(task):
+    '''
+    returns: (scores of the candidates, (key, score) pairs the worker added to
+            its copy of the influence cache, to be merged into the parent's)
+    '''
+    candidates, outgoing_flows, incoming_flows, aligned_nodes = task
+    provenance_graph, candidate_alignments, threshold, time_window, time_respecting = _worker_state
+    cache = influence_cache.get_influence_cache(provenance_graph)
+    cache.journal = []
+    try:
+        candidate_scores = [score_candidate(candidate_alignment, outgoing_flows, incoming_flows, aligned_nodes,
+                                            candidate_alignments, threshold, provenance_graph, time_window, time_respecting)
+                            for candidate_alignment in candidates]
+        return candidate_scores, cache.journal
+    finally:
+        cache.journal = None
+
+def create_scoring_pool(provenance_graph, candidate_alignments, threshold, workers,
+                        time_window=None, time_respecting=False):
+    '''
+    forks a pool of scoring workers that inherit the provenance graph, its
+    indexes and the candidate alignments instead of receiving them pickled
+    returns: a multiprocessing pool, or None if fork is not available
+    '''
+    global _worker_state
+    try:
+        context = multiprocessing.get_context("fork")
+    except ValueError:
+        return None
+    # built before forking, so all workers share one copy
+    process_index.get_process_ancestor_index(provenance_graph)
+    reachability.get_reachability_index(provenance_graph)
+    if time_window is not None or time_respecting:
+        temporal.get_temporal_index(provenance_graph)
+    _worker_state = (provenance_graph, candidate_alignments, threshold, time_window, time_respecting)
+    try:
+        return context.Pool(workers)
+    finally:
+        _worker_state = None
+
+def find_graph_alignment(query_graph, provenance_graph, threshold, seed_node, candidate_alignments, workers=1,
+                         time_window=None, time_respecting=False):
     '''
     params: 
             query_graph -> networkx DiGraph representing query graph
@@ -136,55 +301,52 @@ def find_graph_alignment(query_graph, provenance_graph, threshold, seed_node, ca
             seed_node -> seed node in G_q from which graph exploration
             should start.
             candidate_alignments -> candidate alignments from nodes in G_q to nodes in G_p
+            workers -> number of processes scoring candidates, 1 scores serially;
+            the alignment is the same for any number of workers
+            time_window, time_respecting -> optional temporal constraint on the flows, see scores.find_best_flow
     result: {g_q : g_p}, a mapping from nodes in the query graph to nodes in the provenance graph, representing the best graph
             alignment for the given seed node
     '''
     aligned_nodes = {}
     query_graph_nodes = helpers.do_simple_undirected_bfs(query_graph, seed_node)
-    reverse_query_graph = query_graph.reverse()
-
-    for query_node in query_graph_nodes:
-        outgoing_flows = helpers.do_simple_dfs(query_graph, query_node)
-        outgoing_flows.discard(query_node)
-
-        incoming_flows = helpers.do_simple_dfs(reverse_query_graph, query_node)
-        incoming_flows.discard(query_node)
-
-        candidates = candidate_alignments[query_node]
-        
-        candidate_node_alignment_scores = {}
-        for candidate_alignment in candidates:
-            out_final_influence_score = 0
-            in_final_influence_score = 0
-
-            for outgoing_flow in outgoing_flows:
-                if outgoing_flow not in aligned_nodes:
-                    influence_scores = []
-                    candidate_outgoing_alignments = candidate_alignments[outgoing_flow]
-                    for candidate_outgoing_alignment in candidate_outgoing_alignments:
-                        influence_score = scores.compute_influence_score(candidate_alignment, candidate_outgoing_alignment, threshold, provenance_graph)
-                        influence_scores.append(influence_score)
-                    #TODO: handling empty candidate alignment? meaning nothing found in provenance graph
-                    out_final_influence_score += max(influence_scores)
-                else:
-                    out_final_influence_score += scores.compute_influence_score(candidate_alignment, aligned_nodes[outgoing_flow], threshold, provenance_graph)
-            
-            for incoming_flow in incoming_flows:
-                if incoming_flow not in aligned_nodes:
-                    influence_scores = []
-                    candidate_incoming_alignments = candidate_alignments[incoming_flow]
-                    for candidate_incoming_alignment in candidate_incoming_alignments:
-                        influence_score = scores.compute_influence_score(candidate_incoming_alignment, candidate_alignment, threshold, provenance_graph)
-                        influence_scores.append(influence_score)
-                    #TODO: handling empty candidate alignment? meaning nothing found in provenance graph
-                    in_final_influence_score += max(influence_scores)
-                else:
-                    in_final_influence_score += scores.compute_influence_score(aligned_nodes[incoming_flow], candidate_alignment, threshold, provenance_graph)
-            
-            total_influence_score = out_final_influence_score + in_final_influence_score
-            candidate_node_alignment_scores[candidate_alignment] = total_influence_score
-        
-        aligned_nodes[query_node] = max(candidate_node_alignment_scores, key = candidate_node_alignment_scores.get)
-        print(f"Aligned node for candidate node {query_node} is {aligned_nodes[query_node]}")
+    pool = None
+    if workers > 1:
+        pool = create_scoring_pool(provenance_graph, candidate_alignments, threshold, workers,
+                                   time_window, time_respecting)
+
+    try:
+        for query_node in query_graph_nodes:
+            outgoing_flows = helpers.do_simple_dfs(query_graph, query_node)
+            outgoing_flows.discard(query_node)
+
+            incoming_flows = helpers.do_simple_dfs(query_graph, query_node, direction="reverse")
+            incoming_flows.discard(query_node)
+
+            candidates = candidate_alignments[query_node]
+
+            if pool is None:
+                candidate_scores = [score_candidate(candidate_alignment, outgoing_flows, incoming_flows, aligned_nodes,
+                                                    candidate_alignments, threshold, provenance_graph,
+                                                    time_window, time_respecting)
+                                    for candidate_alignment in candidates]
+            else:
+                # chunks are scored in order, so ties are broken exactly as in the serial loop
+                chunk_size = max(1, len(candidates) // (workers * 4))
+                tasks = [(candidates[i:i + chunk_size], outgoing_flows, incoming_flows, aligned_nodes)
+                         for i in range(0, len(candidates), chunk_size)]
+                candidate_scores = []
+                cache = influence_cache.get_influence_cache(provenance_graph)
+                for chunk_scores, computed in pool.map(score_candidates_in_worker, tasks):
+                    candidate_scores.extend(chunk_scores)
+                    for key, score in computed:
+                        cache.put(key, score)
+
+            candidate_node_alignment_scores = dict(zip(candidates, candidate_scores))
+            aligned_nodes[query_node] = max(candidate_node_alignment_scores, key = candidate_node_alignment_scores.get)
+            profiling.log(f"Aligned node for candidate node {query_node} is {aligned_nodes[query_node]}")
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
     
-    return aligned_nodes
\ No newline at end of file
+    return aligned_nodes
@@ -0,0 +1,130 @@
+# This module indexes the process ancestors of every process node in a graph.
+# The process-only subgraph (edges between two process nodes) is condensed into
+# the DAG of its strongly connected components (see condensation.py). All nodes
+# of a component share the same process ancestors, so ancestors are stored once
+# per component, as a frozenset of component numbers. The sets are propagated
+# in one pass in topological order when the index is built: a component's set
+# is itself joined with the sets of its direct predecessors. Their total size
+# is that of the ancestor relation (a bitset per component would take quadratic
+# memory in the number of components even for unrelated processes). Afterwards,
+# the ancestors of a node and whether one process is an ancestor of another are
+# answered in constant time, without traversing the graph. Edges added to a
+# growing graph (online.py) are applied in place by add_edges, which only
+# touches the sets of the components below the new edge.
+
+import condensation
+import graph_indexes
+import scores
+
+class ProcessAncestorIndex:
+    '''
+    params: graph: the provenance graph
+            reverse: index the graph with all edges reversed (as graph.reverse()
+            would), i.e. process descendants instead of ancestors
+    '''
+    def __init__(self, graph, reverse=False):
+        process_nodes = find_process_nodes(graph)
+        is_process = set(process_nodes)
+        neighbors = graph.predecessors if reverse else graph.__getitem__
+
+        def process_neighbors(node):
+            return [neighbor for neighbor in neighbors(node) if neighbor in is_process]
+
+        dag = condensation.Condensation(process_nodes, process_neighbors)
+        self.reverse = reverse
+        self.component = dag.component
+        self.members = dag.members
+        self.successors = [set(successors) for successors in dag.successors]
+        # predecessors have lower component numbers, so their sets are final
+        self.ancestor_sets = []
+        for number, predecessors in enumerate(dag.predecessors):
+            self.ancestor_sets.append(frozenset([number]).union(*(self.ancestor_sets[predecessor] for predecessor in predecessors)))
+
+    def is_process(self, node):
+        return node in self.component
+
+    def ancestor_components(self, node):
+        '''
+        returns: frozenset of the components holding node's process ancestors
+                (node included), empty if node is not a process
+        '''
+        component = self.component.get(node)
+        if component is None:
+            return frozenset()
+        return self.ancestor_sets[component]
+
+    def is_ancestor(self, ancestor, node):
+        '''
+        returns: whether ancestor is a process ancestor of the process node
+                (every process is its own ancestor)
+        '''
+        component = self.component.get(ancestor)
+        return component is not None and component in self.ancestor_components(node)
+
+    def ancestors(self, node):
+        '''
+        returns: the set of process ancestors of node, node included
+        '''
+        return {member for component in self.ancestor_components(node)
+                for member in self.members[component]}
+
+    def add_edges(self, graph, nodes, edges):
+        '''
+        updates the index after nodes and edges were added to graph
+        params: nodes: the new nodes
+                edges: the new (from, to) edges
+        returns: False if an edge closed a cycle of process components,
+                the index must then be rebuilt
+        '''
+        for node in nodes:
+            if node not in self.component and scores.is_process(graph, node):
+                self.component[node] = len(self.members)
+                self.members.append([node])
+                self.successors.append(set())
+                self.ancestor_sets.append(frozenset([self.component[node]]))
+        for source, target in edges:
+            if self.reverse:
+                source, target = target, source
+            if source not in self.component or target not in self.component:
+                continue
+            source_component = self.component[source]
+            target_component = self.component[target]
+            if source_component in self.ancestor_sets[target_component]:
+                continue
+            if target_component in self.ancestor_sets[source_component]:
+                return False
+            self.successors[source_component].add(target_component)
+            # the components below target gain source's ancestors, a component
+            # that already has them passes them on to everything below it
+            added = self.ancestor_sets[source_component]
+            stack = [target_component]
+            while stack:
+                component = stack.pop()
+                if added <= self.ancestor_sets[component]:
+                    continue
+                self.ancestor_sets[component] = self.ancestor_sets[component] | added
+                stack.extend(self.successors[component])
+        return True
+
+def find_process_nodes(graph):
+    if hasattr(graph, "type_codes"):
+        # compact graphs: compare type codes instead of building Node objects
+        process_codes = [code for code, node_type in enumerate(graph.type_names) if node_type in scores.PROCESS_TYPES]
+        return [node for node, code in enumerate(graph.type_codes.tolist()) if code in process_codes]
+    return [node for node in graph.nodes if scores.is_process(graph, node)]
+
+def get_process_ancestor_index(graph, reverse=False):
+    if reverse:
+        return graph_indexes.get_index(graph, "process_descendants", lambda graph: ProcessAncestorIndex(graph, reverse=True))
+    return graph_indexes.get_index(graph, "process_ancestors", ProcessAncestorIndex)
+
+def update_indexes(graph, nodes, edges):
+    '''
+    brings the cached process-ancestor and -descendant indexes of graph up to
+    date after nodes and edges were added, see ProcessAncestorIndex.add_edges;
+    an index that cannot be updated is dropped and rebuilt when next needed
+    '''
+    for name in ("process_ancestors", "process_descendants"):
+        index = graph_indexes.cached(graph, name)
+        if index is not None and not index.add_edges(graph, nodes, edges):
+            graph_indexes.invalidate(graph, name)
@@ -0,0 +1,97 @@
+# Instrumentation shared by all POIROT stages.
+# A single Profiler collects
+#   stage timers: total seconds and number of calls per named stage
+#   counters:     influence scores computed, hitting-set solves, paths
+#                 enumerated, nodes visited, ...
+# and controls progress output: log() prints unless quiet is set, so large
+# runs do not pay for terminal I/O. Collection is off by default; while it is
+# off, stage() and count() return immediately, so instrumented code costs
+# next to nothing. Reports can be exported as JSON, and cprofile() wraps a
+# block in the standard library profiler.
+
+import cProfile
+import io
+import json
+import pstats
+import time
+from contextlib import contextmanager
+
+class Profiler:
+    def __init__(self):
+        self.enabled = False
+        self.quiet = False
+        self.reset()
+
+    def reset(self):
+        self.seconds = {}
+        self.calls = {}
+        self.counters = {}
+
+    @contextmanager
+    def stage(self, name, timings=None):
+        '''
+        times the enclosed block as stage name
+        params: timings -> optional dict the elapsed seconds are also added to,
+                even when collection is off
+        '''
+        if not self.enabled and timings is None:
+            yield
+            return
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start_time
+            if timings is not None:
+                timings[name] = timings.get(name, 0.0) + elapsed
+            if self.enabled:
+                self.seconds[name] = self.seconds.get(name, 0.0) + elapsed
+                self.calls[name] = self.calls.get(name, 0) + 1
+
+    def count(self, name, amount=1):
+        if self.enabled:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def log(self, message):
+        if not self.quiet:
+            print(message)
+
+    def report(self):
+        return {"stages": {name: {"seconds": seconds, "calls": self.calls[name]}
+                           for name, seconds in self.seconds.items()},
+                "counters": dict(self.counters)}
+
+    def export_json(self, path, extra=None):
+        '''
+        writes the report (updated with the extra dict, if given) to path
+        '''
+        report = self.report()
+        if extra is not None:
+            report.update(extra)
+        with open(path, "w") as f:
+            json.dump(report, f, indent=2)
+
+    @contextmanager
+    def cprofile(self, path=None, sort="cumulative", limit=30):
+        '''
+        profiles the enclosed block with cProfile, the statistics are dumped
+        to path (readable with pstats or snakeviz) or printed if path is None
+        '''
+        profile = cProfile.Profile()
+        profile.enable()
+        try:
+            yield profile
+        finally:
+            profile.disable()
+            if path is not None:
+                profile.dump_stats(path)
+            else:
+                output = io.StringIO()
+                pstats.Stats(profile, stream=output).sort_stats(sort).print_stats(limit)
+                print(output.getvalue())
+
+profiler = Profiler()
+
+stage = profiler.stage
+count = profiler.count
+log = profiler.log
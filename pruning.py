@@ -0,0 +1,138 @@
+# Reachability pre-pruning of the provenance graph.
+# Every score POIROT computes is the influence of a candidate of one query node
+# on a candidate of another query node that it flows to in the query graph, so
+# only nodes on a path from candidates of q1 to candidates of q2, for some query
+# flow q1 -> q2, can ever matter. The relevant nodes are found with one forward
+# and one backward traversal per query node (from all its candidates at once):
+# they are the union, over the query flows, of forward_reach(q1) & backward_reach(q2).
+# The number of compromises of a path depends on the process ancestors (and, for
+# backward expansion, descendants) of its process nodes, so the kept set is
+# closed under both; influence scores on the pruned graph are therefore the same
+# as on the whole graph. Only step 4 runs on the much smaller pruned graph: the
+# search expansion of step 3 walks paths that need not end at a candidate, so it
+# keeps running on the whole graph. Every step 1 candidate is kept (those off
+# every flow just score 0), so step 3's candidates can always be mapped over.
+
+import time
+import networkx as nx
+import compact_graph
+import graph_indexes
+import helpers
+import influence_cache
+import scores
+import traversal
+
+def query_flows(query_graph):
+    '''
+    returns: the (q1, q2) pairs of distinct query nodes such that q2 is reachable from q1
+    '''
+    flows = []
+    for query_node in query_graph.nodes:
+        outgoing_flows = helpers.do_simple_dfs(query_graph, query_node)
+        outgoing_flows.discard(query_node)
+        flows.extend((query_node, outgoing_flow) for outgoing_flow in outgoing_flows)
+    return flows
+
+def relevant_nodes(provenance_graph, query_graph, candidate_alignments):
+    '''
+    returns: the provenance nodes on a path between candidates of a query flow,
+            closed under process ancestors and descendants
+    '''
+    forward_reach = {}
+    backward_reach = {}
+    kept = set()
+    for source, target in query_flows(query_graph):
+        if source not in candidate_alignments or target not in candidate_alignments:
+            continue
+        if source not in forward_reach:
+            reach = set()
+            for candidate in candidate_alignments[source]:
+                traversal.dfs(provenance_graph, candidate, visited=reach)
+            forward_reach[source] = reach
+        if target not in backward_reach:
+            reach = set()
+            for candidate in candidate_alignments[target]:
+                traversal.dfs(provenance_graph, candidate, "reverse", visited=reach)
+            backward_reach[target] = reach
+        kept |= forward_reach[source] & backward_reach[target]
+
+    def is_process(node):
+        return scores.is_process(provenance_graph, node)
+    processes = [node for node in kept if is_process(node)]
+    for direction in ("reverse", "forward"):
+        closure = set()
+        for node in processes:
+            traversal.dfs(provenance_graph, node, direction, visited=closure, predicate=is_process)
+        kept |= closure
+    return kept
+
+def subgraph(provenance_graph, nodes):
+    '''
+    returns: the subgraph induced by nodes, a networkx.DiGraph copy for networkx
+            graphs and a renumbered CompactGraph (keeping the original node IDs)
+            for compact graphs, plus the mapping from old to new nodes
+    '''
+    if not hasattr(provenance_graph, "type_codes"):
+        # built explicitly so nodes and neighbors keep the order of provenance_graph
+        pruned = nx.DiGraph()
+        pruned.add_nodes_from((node, provenance_graph.nodes[node]) for node in provenance_graph.nodes if node in nodes)
+        pruned.add_edges_from((node, neighbor, data) for node in pruned.nodes
+                              for neighbor, data in provenance_graph[node].items() if neighbor in nodes)
+        return pruned, None
+    kept = sorted(nodes)
+    position = {node: i for i, node in enumerate(kept)}
+    sources = []
+    targets = []
+    for node in kept:
+        for neighbor in provenance_graph.successors(node):
+            if neighbor in position:
+                sources.append(position[node])
+                targets.append(position[neighbor])
+    pruned = compact_graph.from_columns([provenance_graph.node_id(node) for node in kept],
+                                        [provenance_graph.node_type(node) for node in kept],
+                                        [provenance_graph.node_label(node) for node in kept],
+                                        sources, targets)
+    return pruned, position
+
+def prune(provenance_graph, query_graph, candidate_alignments):
+    '''
+    params: provenance_graph -> networkx DiGraph (or CompactGraph) representing provenance graph
+            query_graph -> networkx DiGraph representing query graph
+            candidate_alignments -> step 1 candidate alignments
+    returns: (pruned provenance graph, mapping from provenance to pruned nodes
+            or None if they are the same, statistics dict); all candidates are kept
+    '''
+    start_time = time.time()
+    if query_graph.number_of_edges() == 0:
+        # without flows nothing is scored, keep the graph as it is
+        return provenance_graph, None, {
+            "nodes_before": provenance_graph.number_of_nodes(), "nodes_after": provenance_graph.number_of_nodes(),
+            "edges_before": provenance_graph.number_of_edges(), "edges_after": provenance_graph.number_of_edges(),
+            "removed_fraction": 0.0, "seconds": 0.0}
+    kept = relevant_nodes(provenance_graph, query_graph, candidate_alignments)
+    for candidates in candidate_alignments.values():
+        kept.update(candidates)
+    pruned, position = subgraph(provenance_graph, kept)
+    if position is None:
+        # the scores of candidates on the pruned graph are those on the whole
+        # graph and the nodes are the same, so the influence cache is shared
+        # with the whole graph and with the other graphs pruned from it
+        cache = influence_cache.get_influence_cache(provenance_graph)
+        graph_indexes.get_index(pruned, "influence_scores", lambda graph: cache)
+    nodes_before = provenance_graph.number_of_nodes()
+    stats = {"nodes_before": nodes_before, "nodes_after": pruned.number_of_nodes(),
+             "edges_before": provenance_graph.number_of_edges(), "edges_after": pruned.number_of_edges(),
+             "removed_fraction": 1.0 - pruned.number_of_nodes() / nodes_before if nodes_before else 0.0,
+             "seconds": time.time() - start_time}
+    return pruned, position, stats
+
+def map_alignments(candidate_alignments, position):
+    '''
+    params: candidate_alignments -> candidate alignments in the provenance graph
+            position -> mapping returned by prune
+    returns: the candidate alignments in the pruned graph
+    '''
+    if position is None:
+        return candidate_alignments
+    return {query_node: [position[candidate] for candidate in candidates]
+            for query_node, candidates in candidate_alignments.items()}
@@ -0,0 +1,174 @@
+# Reachability index of the provenance graph, answering "is there a path from
+# u to v" without searching the graph in most cases.
+# The graph is condensed into the DAG of its strongly connected components
+# (see condensation.py) and every component gets GRAIL interval labels: for
+# each of a few randomized depth-first traversals of the DAG, the label of a
+# component is [lowest post-order rank below it, its own post-order rank].
+# If v is reachable from u, v's interval lies inside u's in every traversal,
+# so a single traversal where it does not proves that v is unreachable. The
+# components are also numbered in topological order, and no edge goes from a
+# higher to a lower number. Only queries that pass both tests fall back to a
+# depth-first search of the DAG, which skips every component whose labels
+# rule it out. Edges added to a growing graph (online.py) that create new
+# paths are kept aside and followed explicitly, until there are more than
+# PENDING_EDGES of them and the index is rebuilt.
+
+import random
+import condensation
+import graph_indexes
+
+# number of randomized traversals, more labels rule out more pairs up front
+TRAVERSALS = 3
+# added edges followed outside the labels before the index is rebuilt
+PENDING_EDGES = 32
+
+class ReachabilityIndex:
+    '''
+    params: graph: the provenance graph
+            traversals: number of interval labels per component
+            seed: seed of the randomized traversals
+    '''
+    def __init__(self, graph, traversals=TRAVERSALS, seed=0):
+        dag = condensation.Condensation(list(graph.nodes), graph.__getitem__)
+        self.component = dag.component
+        self.successors = dag.successors
+        r = random.Random(seed)
+        roots = [component for component in range(len(dag)) if not dag.predecessors[component]]
+        self.labels = [interval_labels(self.successors, roots, r) for _ in range(traversals)]
+        # source -> targets of the added edges, and the added nodes
+        self.added_edges = {}
+        self.added_nodes = set()
+        self.pending = 0
+
+    def contains(self, outer, inner):
+        '''
+        returns: whether the labels of component inner lie inside those of
+                component outer, necessary for inner to be reachable from outer
+        '''
+        for low, rank in self.labels:
+            if low[inner] < low[outer] or rank[inner] > rank[outer]:
+                return False
+        return True
+
+    def reachable(self, node_a, node_b):
+        '''
+        returns: whether there is a path from node_a to node_b (every node reaches itself)
+        '''
+        if self.indexed_reachable(node_a, node_b):
+            return True
+        if not self.added_edges:
+            return False
+        if node_a == node_b:
+            return node_a in self.added_nodes
+        # paths through added edges: search over the targets of those the
+        # nodes found so far reach
+        visited = {node_a}
+        stack = [node_a]
+        while stack:
+            node = stack.pop()
+            for source, targets in self.added_edges.items():
+                if node != source and not self.indexed_reachable(node, source):
+                    continue
+                for target in targets:
+                    if target == node_b or self.indexed_reachable(target, node_b):
+                        return True
+                    if target not in visited:
+                        visited.add(target)
+                        stack.append(target)
+        return False
+
+    def indexed_reachable(self, node_a, node_b):
+        '''
+        returns: whether there is a path from node_a to node_b in the graph the
+                index was built from
+        '''
+        source = self.component.get(node_a)
+        target = self.component.get(node_b)
+        if source is None or target is None:
+            return False
+        if source == target:
+            return True
+        if source > target or not self.contains(source, target):
+            return False
+        visited = {source}
+        stack = [source]
+        while stack:
+            for successor in self.successors[stack.pop()]:
+                if successor == target:
+                    return True
+                if successor not in visited and successor < target and self.contains(successor, target):
+                    visited.add(successor)
+                    stack.append(successor)
+        return False
+
+    def add_edges(self, nodes, edges):
+        '''
+        updates the index after nodes and edges were added to the graph
+        params: nodes: the new nodes
+                edges: the new (from, to) edges
+        returns: False if too many edges are pending, the index must then be rebuilt
+        '''
+        self.added_nodes.update(node for node in nodes if node not in self.component)
+        for source, target in edges:
+            # an edge between nodes that were already connected adds no path
+            if not self.reachable(source, target):
+                self.added_edges.setdefault(source, []).append(target)
+                self.pending += 1
+        return self.pending <= PENDING_EDGES
+
+def interval_labels(successors, roots, r):
+    '''
+    one randomized post-order traversal of the DAG
+    returns: (low, rank) lists, rank is the post-order rank of each component
+            and low the lowest rank of the components reachable from it
+    '''
+    rank = [None] * len(successors)
+    low = [None] * len(successors)
+    roots = list(roots)
+    r.shuffle(roots)
+    counter = 0
+    for root in roots:
+        work = [(root, iter(r.sample(successors[root], len(successors[root]))))]
+        while work:
+            component, remaining = work[-1]
+            for successor in remaining:
+                # the graph is acyclic, so an unranked successor is not on the stack
+                if rank[successor] is None:
+                    work.append((successor, iter(r.sample(successors[successor], len(successors[successor])))))
+                    break
+            else:
+                work.pop()
+                rank[component] = counter
+                counter += 1
+                low[component] = min([counter - 1] + [low[successor] for successor in successors[component]])
+    return low, rank
+
+def get_reachability_index(graph):
+    return graph_indexes.get_index(graph, "reachability", ReachabilityIndex)
+
+def update_index(graph, nodes, edges):
+    '''
+    brings the cached reachability index of graph up to date after nodes and
+    edges were added, see ReachabilityIndex.add_edges; it is dropped and
+    rebuilt when next needed once too many edges are pending
+    '''
+    index = graph_indexes.cached(graph, "reachability")
+    if index is not None and not index.add_edges(nodes, edges):
+        graph_indexes.invalidate(graph, "reachability")
+
+def reachable(graph, node_a, node_b):
+    return get_reachability_index(graph).reachable(node_a, node_b)
+
+def filter_reachable(graph, node, targets):
+    '''
+    returns: the targets (in order) that are reachable from node
+    '''
+    index = get_reachability_index(graph)
+    return [target for target in targets if index.reachable(node, target)]
+
+def filter_reaching(graph, sources, node):
+    '''
+    returns: the sources (in order) that node is reachable from
+    '''
+    index = get_reachability_index(graph)
+    return [source for source in sources if index.reachable(source, node)]
@@ -1,10 +1,13 @@
 import networkx as nx
-import itertools 
 import helpers
-import time
-
-min_common_ancestors_time = 0.0
-path_finding_time = 0.0
+import hitting_set
+import influence_cache
+import process_index
+import temporal
+import heapq
+import profiling
+import reachability
+import traversal
 
 # def find_single_process_ancestors(graph, node):
 #     '''
@@ -19,14 +22,13 @@ path_finding_time = 0.0
 #     return ancestors
 
 def do_process_dfs(graph, node, visited):
-    if node not in visited and is_process(graph, node):
-        visited.add(node)
-        for neighbor in graph[node]:
-            do_process_dfs(graph, neighbor, visited)
+    return traversal.dfs(graph, node, visited=visited, predicate=lambda node: is_process(graph, node))
+
+PROCESS_TYPES = ("BROWSER", "PROCESS", "LAUNCHER", "SPOOLS", "EXE", "JAVA", "process", "SUBJECT_PROCESS")
 
 def is_process(graph, node):
     node = graph.nodes[node]['node']
-    return node.type in ("BROWSER", "PROCESS", "LAUNCHER", "SPOOLS", "EXE", "JAVA", "process", "SUBJECT_PROCESS")
+    return node.type in PROCESS_TYPES
 
 def find_single_process_ancestors(graph, node):
     '''
@@ -35,10 +37,7 @@ def find_single_process_ancestors(graph, node):
             node: node to find ancestors of
     returns: a set containing process node ancestors of the node
     '''
-    visited = set()
-    reverse_graph = graph.reverse()
-    ancestors = do_process_dfs(reverse_graph, node, visited)
-    return visited
+    return process_index.get_process_ancestor_index(graph).ancestors(node)
 
 def find_process_ancestors_of_nodes(graph, nodes):
     '''
@@ -50,67 +49,193 @@ def find_process_ancestors_of_nodes(graph, nodes):
     all_ancestors = [find_single_process_ancestors(graph, node) for node in nodes]
     return all_ancestors
 
-def find_minimum_common_ancestors(graph, nodes):
+def is_process_ancestor(graph, ancestor, node):
+    '''
+    returns: whether the process ancestor is a process ancestor of node
+            (constant time, see process_index)
+    '''
+    return process_index.get_process_ancestor_index(graph).is_ancestor(ancestor, node)
+
+def process_connected(graph, node_a, node_b):
+    '''
+    returns: whether one of the two process nodes is a process ancestor of the other
+    '''
+    index = process_index.get_process_ancestor_index(graph)
+    return index.is_ancestor(node_a, node_b) or index.is_ancestor(node_b, node_a)
+
+def find_minimum_common_ancestors(graph, nodes, threshold=None):
     '''
     finds minimum number of process common ancestors of a bunch of nodes
     params: graph: networkx.DiGraph describing relationships between nodes
             nodes: nodes to find minimum number of common ancestors of
-    returns: the number of minimum common ancestors shared between the nodes
+            threshold: optional bound, minimums larger than threshold are not computed exactly
+    returns: the number of minimum common ancestors shared between the nodes,
+            or threshold + 1 if that number exceeds threshold
     '''
-    start_time = time.time()
-    process_nodes = [node for node in nodes if is_process(graph, node)]
-    all_ancestors = find_process_ancestors_of_nodes(graph, process_nodes)
-    total = set().union(*all_ancestors)
-    if len(total) == 0:
+    profiling.count("minimum_common_ancestors")
+    # process nodes in the same strongly connected component share their
+    # ancestors, so the hitting set is solved over ancestor components
+    index = process_index.get_process_ancestor_index(graph)
+    all_ancestors = [index.ancestor_components(node) for node in nodes if index.is_process(node)]
+    if len(all_ancestors) == 0:
         return 1
-
-    # brute force algorithm for hitting set problem (NP-Complete)
-    for length in range(1, len(total) + 1):
-        combinations = itertools.combinations(total, length)
-        for combination in combinations:
-            for ancestor_set in all_ancestors:
-                if len(ancestor_set.intersection(set(combination))) == 0:
-                    break
-            else:
-                return len(combination)
+    if all_ancestors[0].intersection(*all_ancestors[1:]):
+        # a single shared ancestor hits every set
+        return 1
+    return hitting_set.minimum_hitting_set_size(all_ancestors, threshold)
             
-def find_all_paths(graph, node_start, node_end, path=[]):
+def find_all_paths(graph, node_start, node_end, path=[], time_window=None, time_respecting=False):
     '''
     given two nodes node_start and node_end,
-    this routine recursively finds all paths between
+    this routine finds all paths between
     the two nodes in the graph graph.
+    time_window and time_respecting optionally restrict the edges
+    paths may use, see temporal.neighbor_function
+    '''
+    with profiling.stage("find_all_paths"):
+        steps = temporal.neighbor_function(graph, "forward", time_window, time_respecting)
+        paths = list(traversal.simple_paths(graph, node_start, node_end, path=path, steps=steps))
+    profiling.count("paths_enumerated", len(paths))
+    return paths
+
+def extend_path_cost(cost, hitting, ancestor_sets, threshold=None):
+    '''
+    incrementally updates the minimum number of compromises of a path
+    after a process node was appended to it
+    params: cost: minimum number of compromises of the path before the node was appended
+            hitting: a minimum hitting set achieving cost (None if the path had no process
+            nodes or cost exceeds threshold)
+            ancestor_sets: ancestor components of the path's process nodes, ending with the
+            ancestors of the appended node
+            threshold: optional bound, costs above it are reported as threshold + 1
+    returns: (cost, hitting) of the extended path
+    '''
+    if threshold is not None and cost > threshold:
+        return cost, None
+    ancestors = ancestor_sets[-1]
+    if hitting is None:
+        return 1, frozenset([next(iter(ancestors))])
+    if not hitting.isdisjoint(ancestors):
+        return cost, hitting
+    # the new minimum is either cost (some other hitting set of that size
+    # also hits the new ancestors) or cost + 1 (the old one plus any ancestor)
+    same_size = hitting_set.minimum_hitting_set(ancestor_sets, cost)
+    if same_size is not None:
+        return cost, frozenset(same_size)
+    if threshold is not None and cost + 1 > threshold:
+        return threshold + 1, None
+    return cost + 1, hitting | {next(iter(ancestors))}
 
-    credits: https://stackoverflow.com/a/24471320/
-    '''
-    global path_finding_time
-    print("Finding all paths...")
-    start_time = time.time()
-    path = path + [node_start]
-    if node_start == node_end:
-        end_time = time.time()
-        elapsed_time = end_time - start_time
-        path_finding_time += elapsed_time
-        print(f"Done Finding Paths\nPath Finding Time: {path_finding_time: .2f}")
-        return [path]
+def add_ancestor_set(ancestor_sets, ancestors):
+    '''
+    returns: the family of ancestor sets ancestor_sets with ancestors added,
+            keeping only its minimal sets (a set containing another one is hit
+            whenever the smaller one is, so it never changes the cost)
+    '''
+    if any(other <= ancestors for other in ancestor_sets):
+        return ancestor_sets
+    return tuple(other for other in ancestor_sets if not ancestors <= other) + (ancestors,)
+
+class PathCost:
+    '''
+    tracks the minimum number of compromises of a path (as computed by
+    find_minimum_common_ancestors) while nodes are pushed onto and popped
+    off its end, so a traversal only pays for the change at each step.
+    With reverse, costs are those of the path on graph.reverse().
+    '''
+    def __init__(self, graph, threshold=None, reverse=False):
+        self.index = process_index.get_process_ancestor_index(graph, reverse)
+        self.threshold = threshold
+        self.ancestor_sets = []
+        # (cost, hitting set, whether the node added to ancestor_sets) per pushed node
+        self.states = [(1, None, False)]
+
+    @property
+    def cost(self):
+        return self.states[-1][0]
+
+    def push(self, node):
+        cost, hitting, _ = self.states[-1]
+        is_process = self.index.is_process(node)
+        if is_process:
+            self.ancestor_sets.append(self.index.ancestor_components(node))
+            cost, hitting = extend_path_cost(cost, hitting, self.ancestor_sets, self.threshold)
+        self.states.append((cost, hitting, is_process))
+
+    def pop(self):
+        if self.states.pop()[2]:
+            self.ancestor_sets.pop()
+
+def find_best_flow(graph, node_start, node_end, threshold, time_window=None, time_respecting=False):
+    '''
+    given two nodes node_start and node_end, searches the flows between
+    them in order of increasing minimum number of compromises (best-first).
+    Appending nodes to a flow never lowers its number of compromises, so
+    the first flow that reaches node_end is the one needing the fewest, and
+    partial flows that already need more than threshold are pruned. No path
+    list is materialized.
+    Flows are walks, which may repeat nodes: cutting a cycle out of a walk
+    only removes ancestor sets, so the best walk costs as much as the best
+    simple path. This allows dominance pruning: a partial flow reaching a
+    node is dropped when a flow already expanded from that node had a subset
+    of its (minimal) ancestor sets, as every continuation costs at least as
+    much for it. Revisiting a node on a cycle is always dominated this way.
+    Cutting a cycle out of a time-respecting walk keeps it time-respecting,
+    so with time_respecting a flow only dominates another one if it also
+    reached the node no later in time (see temporal.neighbor_function).
+    params: graph: networkx.DiGraph describing relationships between nodes
+            node_start, node_end: endpoints of the flow
+            threshold: upper bound for number of distinct compromises
+            time_window, time_respecting: optional temporal constraint on the
+            edges of the flow, as in temporal.neighbor_function
+    returns: (cmin, pruned) where cmin is the minimum number of compromises
+            over all flows, or None if no flow needs at most threshold, and
+            pruned is the number of partial flows cut off at the threshold
+    '''
     if node_start not in graph:
-        end_time = time.time()
-        elapsed_time = end_time - start_time
-        path_finding_time += elapsed_time
-        print(f"Done Finding Paths\nPath Finding Time: {path_finding_time: .2f}")
-        return []
-    paths = []
-    for node in graph[node_start]:
-        if node not in path:
-            newpaths = find_all_paths(graph, node, node_end, path)
-            for newpath in newpaths:
-                paths.append(newpath)
-    end_time = time.time()
-    elapsed_time = end_time - start_time
-    path_finding_time += elapsed_time
-    print(f"Done Finding Paths\nPath Finding Time: {path_finding_time: .2f}")
-    return paths
+        return None, 0
+    index = process_index.get_process_ancestor_index(graph)
+    steps = temporal.neighbor_function(graph, "forward", time_window, time_respecting)
+    pruned = 0
+    dominated = 0
+    counter = 0
+    cost, hitting, ancestor_sets = 1, None, ()
+    if index.is_process(node_start):
+        ancestor_sets = (index.ancestor_components(node_start),)
+        cost, hitting = extend_path_cost(cost, hitting, ancestor_sets, threshold)
+    if cost > threshold:
+        return None, 1
+    # (ancestor set family, time bound) of the flows expanded from each node,
+    # the bound is the time of the last timed edge (None without time_respecting)
+    expanded = {}
+    heap = [(cost, counter, node_start, ancestor_sets, hitting, None)]
+    while heap:
+        cost, _, node, ancestor_sets, hitting, bound = heapq.heappop(heap)
+        if node == node_end:
+            profiling.count("dominated_flows", dominated)
+            return cost, pruned
+        family = frozenset(ancestor_sets)
+        flows = expanded.setdefault(node, [])
+        if any(other <= family and (other_bound is None or (bound is not None and other_bound <= bound))
+               for other, other_bound in flows):
+            dominated += 1
+            continue
+        flows.append((family, bound))
+        for neighbor, neighbor_bound in steps(node, bound):
+            new_cost, new_hitting, new_ancestor_sets = cost, hitting, ancestor_sets
+            if index.is_process(neighbor):
+                new_ancestor_sets = add_ancestor_set(ancestor_sets, index.ancestor_components(neighbor))
+                if new_ancestor_sets is not ancestor_sets:
+                    new_cost, new_hitting = extend_path_cost(cost, hitting, new_ancestor_sets, threshold)
+            if new_cost > threshold:
+                pruned += 1
+                continue
+            counter += 1
+            heapq.heappush(heap, (new_cost, counter, neighbor, new_ancestor_sets, new_hitting, neighbor_bound))
+    profiling.count("dominated_flows", dominated)
+    return None, pruned
 
-def compute_influence_score(node_a, node_b, threshold, provenance_graph):
+def compute_influence_score(node_a, node_b, threshold, provenance_graph, time_window=None, time_respecting=False):
     '''
     This computes the influence score gamma(i, j) (page 1800)
     where i and j are the two nodes between whom the
@@ -119,24 +244,35 @@ def compute_influence_score(node_a, node_b, threshold, provenance_graph):
           : end node: node_b
           : threshold: upper bound for number of distinct compromises attacker can reasonably exploit
           : filename: the filename representing the graph
+          : time_window, time_respecting: optional temporal constraint on the flows, see find_best_flow
     returns: the influence score, gamma(i, j)
     '''
-    # now that we have graph, try to find all paths
-    # between the two nodes node_a and node_b
+    # search the flows between node_a and node_b in order of increasing
+    # number of compromise points, the first one found within the
+    # threshold determines the score
+    profiling.count("influence_scores")
     if node_a == node_b and is_process(provenance_graph, node_a) and is_process(provenance_graph, node_b):
         return 0
-    all_flows = find_all_paths(provenance_graph, node_a, node_b)
-    # now that we have all paths/flows, find the minimum
-    # number of compromise points for the attacker in
-    # these flows/paths
-    gamma = 0
-    for flow in all_flows:
-        cmin = find_minimum_common_ancestors(provenance_graph, flow)
-        if cmin != 0 and cmin <= threshold:
-            gamma = max(gamma, 1.0/cmin)
+    if not reachability.reachable(provenance_graph, node_a, node_b):
+        # no flow at all, answered by the index without searching
+        profiling.count("unreachable_pairs")
+        return 0
+    cache = influence_cache.get_influence_cache(provenance_graph)
+    key = (node_a, node_b, threshold)
+    if time_window is not None or time_respecting:
+        key += (tuple(time_window) if time_window is not None else None, time_respecting)
+    gamma = cache.get(key)
+    if gamma is not None:
+        return gamma
+    with profiling.stage("find_best_flow"):
+        cmin, pruned = find_best_flow(provenance_graph, node_a, node_b, threshold, time_window, time_respecting)
+    profiling.count("influence_scores_computed")
+    profiling.count("pruned_paths", pruned)
+    gamma = 0 if cmin is None else 1.0/cmin
+    cache.put(key, gamma)
     return gamma
 
-def compute_alignment_score(query_graph, provenance_graph, aligned_nodes, threshold):
+def compute_alignment_score(query_graph, provenance_graph, aligned_nodes, threshold, time_window=None, time_respecting=False):
     '''
     This computes the alignment score between two graph alignments
     S(Gq :: Gp) where Gq is query graph and Gp is alignment from
@@ -146,6 +282,7 @@ def compute_alignment_score(query_graph, provenance_graph, aligned_nodes, thresh
             provenance_graph -> networkx DiGraph representing provenance graph
             aligned_nodes -> graph alignment obtained from step 4 of poirot
             threshold -> upper bound for number of distinct compromises attacker can reasonably exploit
+            time_window, time_respecting -> optional temporal constraint on the flows, see find_best_flow
     returns: alignment score as outlined in equation 2.
     '''
     
@@ -157,7 +294,7 @@ def compute_alignment_score(query_graph, provenance_graph, aligned_nodes, thresh
         for outgoing_flow in outgoing_flows:
             influence_score = compute_influence_score(aligned_nodes[node],
                     aligned_nodes[outgoing_flow], threshold,
-                    provenance_graph)
+                    provenance_graph, time_window, time_respecting)
             total_influence_score += influence_score
             # F(G) is the set of all flows s.t. i != j
             # if aligned_nodes[node] != aligned_nodes[visited_node]:
@@ -0,0 +1,106 @@
+# Seeded generator of synthetic provenance graphs with planted attacks.
+# Background activity is a forest of processes (parent -> child edges, so
+# processes have process ancestors like in real captures) where every process
+# writes to, reads from (file -> process edges) or connects to a few random
+# files, network flows and other processes. Node types and labels follow the
+# E3 conventions main.compare expects (SUBJECT_PROCESS, FileObject,
+# NetFlowObject). An attack is a query graph planted as fresh nodes with the
+# query's labels and edges, loosely attached to the background.
+
+import random
+import networkx as nx
+from node import Node
+
+PROCESS_TYPE = "SUBJECT_PROCESS"
+FILE_TYPE = "FileObject"
+NETFLOW_TYPE = "NetFlowObject"
+
+# provenance type of each query node type
+PLANTED_TYPES = {"PROCESS": PROCESS_TYPE, "FILE": FILE_TYPE, "IP": NETFLOW_TYPE}
+
+def add_node(graph, node_id, node_type, label):
+    graph.add_node(node_id, node=Node(node_id, node_type, label))
+
+def generate_provenance_graph(num_nodes, process_fraction=0.3, file_fraction=0.5, netflow_fraction=0.2,
+                              fan_out=2, parent_probability=0.5, attacks=(), seed=0):
+    '''
+    params: num_nodes -> number of background nodes
+            process_fraction, file_fraction, netflow_fraction -> node type mix (normalized)
+            fan_out -> average number of edges from each process to other nodes
+            parent_probability -> probability that a process has a parent process
+            attacks -> query graphs (networkx DiGraphs of PROCESS/FILE/IP nodes) to plant
+            seed -> random seed, the same arguments always give the same graph
+    returns: (provenance graph, list of planted alignments {query node: provenance node}, one per attack)
+    '''
+    r = random.Random(seed)
+    total = process_fraction + file_fraction + netflow_fraction
+    num_processes = max(1, int(num_nodes * process_fraction / total))
+    num_files = int(num_nodes * file_fraction / total)
+    num_netflows = max(0, num_nodes - num_processes - num_files)
+
+    graph = nx.DiGraph()
+    processes = [f"process{i}" for i in range(num_processes)]
+    files = [f"file{i}" for i in range(num_files)]
+    netflows = [f"netflow{i}" for i in range(num_netflows)]
+    # labels are drawn from smaller pools, so several nodes share a name as in real logs
+    for node_id in processes:
+        add_node(graph, node_id, PROCESS_TYPE, f"/usr/bin/proc{r.randrange(max(1, num_processes // 4))}")
+    for node_id in files:
+        add_node(graph, node_id, FILE_TYPE, f"/home/user/file{r.randrange(max(1, num_files // 2))}")
+    for node_id in netflows:
+        add_node(graph, node_id, NETFLOW_TYPE, f"10.{r.randrange(256)}.{r.randrange(256)}.{r.randrange(256)} {r.choice([22, 53, 80, 443])}")
+
+    for i, process in enumerate(processes[1:], 1):
+        if r.random() < parent_probability:
+            graph.add_edge(processes[r.randrange(i)], process)
+    others = files + netflows + processes
+    for process in processes:
+        for _ in range(r.randint(0, 2 * fan_out)):
+            target = r.choice(others)
+            if target == process:
+                continue
+            if graph.nodes[target]['node'].type == FILE_TYPE and r.random() < 0.5:
+                graph.add_edge(target, process)
+            else:
+                graph.add_edge(process, target)
+
+    planted = []
+    for attack_number, query_graph in enumerate(attacks):
+        alignment = {}
+        for query_node_id in query_graph.nodes:
+            query_node = query_graph.nodes[query_node_id]['node']
+            node_id = f"attack{attack_number}_{query_node_id}"
+            add_node(graph, node_id, PLANTED_TYPES[query_node.type], query_node.label)
+            alignment[query_node_id] = node_id
+        for u, v in query_graph.edges:
+            graph.add_edge(alignment[u], alignment[v])
+        for node_id in alignment.values():
+            if graph.nodes[node_id]['node'].type == PROCESS_TYPE and processes and r.random() < 0.5:
+                graph.add_edge(r.choice(processes), node_id)
+        planted.append(alignment)
+    return graph, planted
+
+def generate_query_graph(hops, seed=0):
+    '''
+    params: hops -> number of edges of the query (a chain alternating
+            processes with the files and addresses they touch)
+    returns: a query graph in the format of loaders.load_txt_graph
+    '''
+    r = random.Random(seed)
+    query_graph = nx.DiGraph()
+    previous = f"malware{r.randrange(1000)}"
+    query_graph.add_node(previous, node=Node(previous, "PROCESS", previous))
+    for hop in range(hops):
+        if query_graph.nodes[previous]['node'].type == "PROCESS":
+            if hop == hops - 1:
+                label, node_type = f"203.0.113.{r.randrange(256)} 443", "IP"
+            else:
+                label, node_type = f"/tmp/payload{r.randrange(1000)}", "FILE"
+            query_graph.add_node(label, node=Node(label, node_type, label))
+            query_graph.add_edge(previous, label)
+        else:
+            label, node_type = f"dropper{r.randrange(1000)}", "PROCESS"
+            query_graph.add_node(label, node=Node(label, node_type, label))
+            query_graph.add_edge(previous, label)
+        previous = label
+    return query_graph
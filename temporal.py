@@ -0,0 +1,156 @@
+# Temporal index of the provenance graph's edge timestamps.
+# The converters keep the earliest event timestamp of every edge as its
+# 'timestamp' attribute (see graph_builder). TemporalIndex normalizes those
+# timestamps (integers, numeric strings or ISO 8601 dates) to numbers and keeps
+# the edges sorted by time, so the edges of a time window are found by bisection.
+# Traversals can be constrained in two ways:
+#   time window:    only edges whose timestamp lies in [start, end] are followed
+#   time-respecting: along a path, edge timestamps never decrease (forward) or
+#                   never increase (walking edges backwards), i.e. flows that
+#                   would go backwards in time are not followed
+# Edges without a timestamp are never filtered out and do not constrain the
+# edges after them. Compact (.pgraph) graphs store no edge timestamps, so they
+# cannot be indexed and TemporalIndex raises a TypeError for them.
+# Steps 3 and 4 take these constraints (main.py --time-window and
+# --time-respecting). window() and sliding_windows() instead materialize the
+# edges of a window as a small graph, on which all POIROT steps run unchanged.
+
+import bisect
+import itertools
+from datetime import datetime
+import networkx as nx
+import graph_indexes
+import traversal
+
+def to_time(value):
+    '''
+    returns: value as a number (seconds since the epoch for ISO 8601 dates),
+            or None if it is missing or not a time
+    '''
+    if value is None or isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return None if value != value else value
+    text = str(value).strip()
+    if text == "":
+        return None
+    try:
+        return int(text)
+    except ValueError:
+        pass
+    try:
+        return float(text)
+    except ValueError:
+        pass
+    try:
+        return datetime.fromisoformat(text).timestamp()
+    except ValueError:
+        return None
+
+class TemporalIndex:
+    def __init__(self, graph):
+        if hasattr(graph, "type_codes"):
+            raise TypeError("compact (.pgraph) graphs carry no edge timestamps, "
+                            "time windows and time-respecting search need a networkx graph")
+        self.edge_times = {}
+        timed = []
+        self.untimed = []
+        for u, v, timestamp in graph.edges(data='timestamp'):
+            time = to_time(timestamp)
+            if time is None:
+                self.untimed.append((u, v))
+            else:
+                self.edge_times[(u, v)] = time
+                timed.append((time, u, v))
+        timed.sort(key=lambda edge: edge[0])
+        self.times = [time for time, _, _ in timed]
+        self.edges = [(u, v) for _, u, v in timed]
+
+    def edge_time(self, u, v):
+        return self.edge_times.get((u, v))
+
+    def first_time(self):
+        return self.times[0] if self.times else None
+
+    def last_time(self):
+        return self.times[-1] if self.times else None
+
+    def edges_between(self, start=None, end=None):
+        '''
+        returns: the timestamped edges with start <= timestamp <= end, in time order
+        '''
+        low = 0 if start is None else bisect.bisect_left(self.times, start)
+        high = len(self.times) if end is None else bisect.bisect_right(self.times, end)
+        return self.edges[low:high]
+
+def get_temporal_index(graph):
+    return graph_indexes.get_index(graph, "temporal", TemporalIndex)
+
+def neighbor_function(graph, direction="forward", time_window=None, time_respecting=False):
+    '''
+    params: graph: graph to traverse
+            direction: "forward" or "reverse"
+            time_window: optional (start, end), either may be None for an open end
+            time_respecting: only follow edges that keep paths ordered in time
+    returns: a function (node, bound) -> iterable of (neighbor, bound of the neighbor),
+            where bound is the timestamp of the last timed edge walked on the path
+            (None at the start of a path)
+    '''
+    neighbors = traversal.neighbor_function(graph, direction)
+    if time_window is None and not time_respecting:
+        return lambda node, bound: zip(neighbors(node), itertools.repeat(None))
+    edge_times = get_temporal_index(graph).edge_times
+    start, end = time_window if time_window is not None else (None, None)
+    start, end = to_time(start), to_time(end)
+    reverse = direction == "reverse"
+
+    def timed_neighbors(node, bound):
+        for neighbor in neighbors(node):
+            time = edge_times.get((neighbor, node) if reverse else (node, neighbor))
+            if time is None:
+                yield neighbor, bound
+                continue
+            if (start is not None and time < start) or (end is not None and time > end):
+                continue
+            if time_respecting:
+                if bound is not None and (time > bound if reverse else time < bound):
+                    continue
+                yield neighbor, time
+            else:
+                yield neighbor, bound
+    return timed_neighbors
+
+def window(graph, start=None, end=None):
+    '''
+    returns: a networkx.DiGraph with the edges of graph whose timestamp lies in
+            [start, end] and the edges without timestamp, with their nodes and attributes
+    '''
+    index = get_temporal_index(graph)
+    edges = index.edges_between(to_time(start), to_time(end)) + index.untimed
+    subgraph = nx.DiGraph()
+    for u, v in edges:
+        for node in (u, v):
+            if node not in subgraph:
+                subgraph.add_node(node, node=graph.nodes[node]['node'])
+        subgraph.add_edge(u, v, **graph.edges[u, v])
+    return subgraph
+
+def sliding_windows(graph, width, step=None, start=None, end=None):
+    '''
+    params: width: length of each window, in the units of the timestamps
+            (nanoseconds for E3, seconds for dates)
+            step: distance between window starts, defaults to width (tumbling windows)
+            start, end: time range to scan, defaults to the range of the edge timestamps
+    returns: generator of (window start, window end, window graph)
+    '''
+    index = get_temporal_index(graph)
+    step = width if step is None else step
+    start = index.first_time() if start is None else to_time(start)
+    end = index.last_time() if end is None else to_time(end)
+    if start is None or end is None:
+        return
+    window_start = start
+    while window_start <= end:
+        window_end = window_start + width
+        yield window_start, window_end, window(graph, window_start, window_end)
+        window_start += step
@@ -0,0 +1,48 @@
+# Compares scores.find_best_flow with the minimum over all simple paths
+# (scores.find_all_paths) on small random graphs with edge timestamps, with
+# and without temporal constraints. Run with python -m pytest.
+
+import random
+import scores
+from test_expansion import random_graph
+
+def timed_random_graph(r, nodes, edges):
+    graph = random_graph(r, nodes, edges)
+    for u, v in graph.edges:
+        # some edges carry no timestamp and are never filtered out
+        if r.random() < 0.8:
+            graph.edges[u, v]['timestamp'] = r.randrange(10)
+    return graph
+
+def brute_force_cmin(graph, node_start, node_end, threshold, time_window, time_respecting):
+    costs = [scores.find_minimum_common_ancestors(graph, path, threshold)
+             for path in scores.find_all_paths(graph, node_start, node_end, [node_start],
+                                               time_window=time_window, time_respecting=time_respecting)]
+    cmin = min(costs, default=None)
+    return None if cmin is None or cmin > threshold else cmin
+
+def test_best_flow_matches_path_enumeration():
+    r = random.Random(0)
+    for _ in range(40):
+        graph = timed_random_graph(r, r.randint(4, 9), r.randint(4, 18))
+        nodes = list(graph.nodes)
+        for _ in range(10):
+            node_start, node_end = r.choice(nodes), r.choice(nodes)
+            if node_start == node_end:
+                continue
+            for time_window, time_respecting in [(None, False), ((2, 7), False), (None, True), ((None, 6), True)]:
+                for threshold in (1, 2, 3):
+                    expected = brute_force_cmin(graph, node_start, node_end, threshold, time_window, time_respecting)
+                    cmin, _ = scores.find_best_flow(graph, node_start, node_end, threshold, time_window, time_respecting)
+                    assert cmin == expected, (node_start, node_end, threshold, time_window, time_respecting)
+
+def test_influence_cache_keeps_constraints_apart():
+    r = random.Random(1)
+    graph = timed_random_graph(r, 3, 0)
+    a, b, c = graph.nodes
+    graph.add_edge(a, b, timestamp=5)
+    graph.add_edge(b, c, timestamp=1)
+    assert scores.compute_influence_score(a, c, 2, graph) > 0
+    assert scores.compute_influence_score(a, c, 2, graph, time_respecting=True) == 0
+    assert scores.compute_influence_score(a, c, 2, graph, time_window=(0, 4)) == 0
+    assert scores.compute_influence_score(a, c, 2, graph, time_window=(0, 5)) > 0
@@ -0,0 +1,35 @@
+# Compares condensation.Condensation with networkx's strongly connected
+# components on small random graphs. Run with python -m pytest.
+
+import random
+import networkx as nx
+import condensation
+
+def random_digraph(r):
+    graph = nx.DiGraph()
+    nodes = r.randint(1, 30)
+    graph.add_nodes_from(range(nodes))
+    for _ in range(r.randint(0, 3 * nodes)):
+        graph.add_edge(r.randrange(nodes), r.randrange(nodes))
+    return graph
+
+def test_components_match_networkx():
+    r = random.Random(0)
+    for _ in range(300):
+        graph = random_digraph(r)
+        dag = condensation.Condensation(list(graph.nodes), graph.__getitem__)
+        assert sorted(map(sorted, dag.members)) == sorted(map(sorted, nx.strongly_connected_components(graph)))
+        for number, members in enumerate(dag.members):
+            assert all(dag.component[node] == number for node in members)
+        assert set(dag.component) == set(graph.nodes)
+
+def test_components_are_in_topological_order():
+    r = random.Random(1)
+    for _ in range(300):
+        graph = random_digraph(r)
+        dag = condensation.Condensation(list(graph.nodes), graph.__getitem__)
+        edges = {(dag.component[u], dag.component[v]) for u, v in graph.edges
+                 if dag.component[u] != dag.component[v]}
+        assert all(u < v for u, v in edges)
+        assert edges == {(u, v) for u in range(len(dag)) for v in dag.successors[u]}
+        assert edges == {(u, v) for v in range(len(dag)) for u in dag.predecessors[v]}
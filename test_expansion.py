@@ -0,0 +1,80 @@
+# Compares step 3 (poirot.search_expansion) with the original expansion,
+# which ran a separate threshold-bounded dfs from every start node in every
+# round, on small random graphs. Run with python -m pytest.
+
+import io
+import contextlib
+import random
+import networkx as nx
+import main
+import poirot
+import scores
+from node import Node
+
+NODE_TYPES = ["SUBJECT_PROCESS", "SUBJECT_PROCESS", "SUBJECT_PROCESS", "FileObject", "FileObject", "NetFlowObject"]
+
+def random_graph(r, nodes, edges):
+    graph = nx.DiGraph()
+    for i in range(nodes):
+        node_type = r.choice(NODE_TYPES)
+        label = f"/tmp/f{i % 4}" if node_type == "FileObject" else f"{node_type}{i}"
+        graph.add_node(f"n{i}", node=Node(f"n{i}", node_type, label))
+    for _ in range(edges):
+        a, b = r.randrange(nodes), r.randrange(nodes)
+        if a != b:
+            graph.add_edge(f"n{a}", f"n{b}")
+    return graph
+
+def query_graph():
+    graph = nx.DiGraph()
+    for node_id, node_type in [("p", "PROCESS"), ("/tmp/f1", "FILE"), ("q", "PROCESS"), ("ip", "IP")]:
+        graph.add_node(node_id, node=Node(node_id, node_type, node_id))
+    graph.add_edges_from([("p", "/tmp/f1"), ("/tmp/f1", "q"), ("q", "ip")])
+    return graph
+
+def reference_dfs(graph, node, visited, path, threshold):
+    if node not in visited:
+        visited.add(node)
+        if scores.find_minimum_common_ancestors(graph, path, threshold) < threshold:
+            for neighbor in graph[node]:
+                reference_dfs(graph, neighbor, visited, path + [neighbor], threshold)
+
+def reference_expansion(candidate_alignments, seed_node, query_graph, provenance_graph, threshold):
+    reverse_provenance_graph = provenance_graph.reverse(copy=False)
+    all_nodes_visited = set()
+    query_nodes_to_visit = set(query_graph.nodes)
+    start_nodes = candidate_alignments[seed_node]
+    count = 0
+    while len(query_nodes_to_visit) > 0 and count < 20:
+        count += 1
+        for node in start_nodes:
+            visited = set()
+            reference_dfs(provenance_graph, node, visited, [node], threshold)
+            backward_visited = set()
+            reference_dfs(reverse_provenance_graph, node, backward_visited, [node], threshold)
+            all_nodes_visited |= visited | backward_visited
+        for query_node, candidates in candidate_alignments.items():
+            if any(candidate in all_nodes_visited for candidate in candidates):
+                query_nodes_to_visit.discard(query_node)
+        start_nodes = {neighbor for node in provenance_graph.nodes if node not in all_nodes_visited
+                       for neighbor in list(provenance_graph[node]) + list(reverse_provenance_graph[node])
+                       if neighbor in all_nodes_visited}
+    return {query_node: {candidate for candidate in candidates if candidate in all_nodes_visited}
+            for query_node, candidates in candidate_alignments.items()
+            if any(candidate in all_nodes_visited for candidate in candidates)}
+
+def test_search_expansion_matches_per_source_expansion():
+    r = random.Random(0)
+    query = query_graph()
+    for _ in range(60):
+        graph = random_graph(r, r.randint(10, 40), r.randint(10, 70))
+        with contextlib.redirect_stdout(io.StringIO()):
+            candidate_alignments = poirot.find_candidate_node_alignments_with_custom_comparison(query, graph, main.compare)
+        if candidate_alignments.keys() != set(query.nodes):
+            continue
+        for threshold in (1, 2, 3):
+            for i in range(len(query.nodes)):
+                seed_node = poirot.select_seed_node(candidate_alignments, i)
+                expected = reference_expansion(candidate_alignments, seed_node, query, graph, threshold)
+                result = poirot.search_expansion(candidate_alignments, seed_node, query, graph, threshold)
+                assert {query_node: set(candidates) for query_node, candidates in result.items()} == expected
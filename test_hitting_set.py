@@ -0,0 +1,42 @@
+# Compares the exact hitting set solver with brute-force enumeration on small
+# random instances. Run with python -m pytest.
+
+import itertools
+import random
+import hitting_set
+
+def brute_force_minimum(sets):
+    elements = sorted(set().union(*sets))
+    for size in range(len(elements) + 1):
+        for combination in itertools.combinations(elements, size):
+            if all(not element_set.isdisjoint(combination) for element_set in sets):
+                return size
+    return None
+
+def random_sets(r):
+    universe = r.randint(1, 8)
+    return [set(r.sample(range(universe), r.randint(1, universe))) for _ in range(r.randint(1, 7))]
+
+def test_minimum_matches_enumeration():
+    r = random.Random(0)
+    for _ in range(500):
+        sets = random_sets(r)
+        minimum = brute_force_minimum(sets)
+        chosen = hitting_set.minimum_hitting_set(sets)
+        assert len(chosen) == minimum
+        assert all(not element_set.isdisjoint(chosen) for element_set in sets)
+
+def test_limit():
+    r = random.Random(1)
+    for _ in range(500):
+        sets = random_sets(r)
+        minimum = brute_force_minimum(sets)
+        for limit in range(4):
+            expected = minimum if minimum <= limit else limit + 1
+            assert hitting_set.minimum_hitting_set_size(sets, limit) == expected
+            assert (hitting_set.minimum_hitting_set(sets, limit) is None) == (minimum > limit)
+
+def test_empty_set_cannot_be_hit():
+    assert hitting_set.minimum_hitting_set([{1}, set()]) is None
+    assert hitting_set.minimum_hitting_set_size([{1}, set()], 2) == 3
+    assert hitting_set.minimum_hitting_set_size([]) == 0
@@ -0,0 +1,43 @@
+# Compares label_index.PatternIndex with a linear scan over all labels on
+# random labels and patterns. Run with python -m pytest.
+
+import random
+import label_index
+
+DIRECTORIES = ["/tmp", "/etc", "/usr/bin", "/home/user", "/var/log"]
+NAMES = ["bash", "sh", "passwd", "shadow", "a.sh", "b.txt", "x*y", "run[1]"]
+
+def random_labels(r):
+    labels = []
+    for _ in range(300):
+        kind = r.randrange(3)
+        if kind == 0:
+            labels.append(f"{r.choice(DIRECTORIES)}/{r.choice(NAMES)}")
+        elif kind == 1:
+            labels.append(f"10.{r.randrange(3)}.{r.randrange(4)}.{r.randrange(256)} {r.choice([80, 443])}")
+        else:
+            labels.append(f"[2001:db8::{r.randrange(16):x}]:{r.choice([80, 443])}")
+    return labels
+
+PATTERNS = ["glob:/tmp/*", "glob:/tmp/*.sh", "glob:*/bash", "glob:*sh", "glob:/usr/bin/?ash",
+            "glob:*/[ab].*", "glob:/etc/passwd", "glob:*", "glob:/var/*/*", "glob:*/x[*]y",
+            "10.0.0.0/8", "10.1.0.0/16", "10.2.3.0/28", "2001:db8::/125", "192.168.0.0/16",
+            "re:^/etc/(passwd|shadow)$", "re:sh$", "re:443"]
+
+def test_positions_match_linear_scan():
+    r = random.Random(0)
+    for _ in range(20):
+        labels = random_labels(r)
+        label_positions = {}
+        for position, label in enumerate(labels):
+            label_positions.setdefault(label, []).append(position)
+        index = label_index.PatternIndex(label_positions)
+        for text in PATTERNS:
+            pattern = label_index.parse_pattern(text)
+            assert pattern is not None
+            expected = [position for position, label in enumerate(labels) if pattern.matches(label)]
+            assert index.positions(pattern) == expected, text
+
+def test_plain_labels_are_not_patterns():
+    for text in ["/tmp/a*b", "bash", "run[1]", "/not/a/network"]:
+        assert label_index.parse_pattern(text) is None
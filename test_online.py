@@ -0,0 +1,62 @@
+# Checks that online detection gives, after every batch of new edges, the
+# verdict, alignment and score of main.detect run from scratch on the same
+# graph, and that the indexes it updates in place match rebuilt ones.
+# Run with python -m pytest.
+
+import io
+import contextlib
+import random
+import networkx as nx
+import main
+import online
+import poirot
+import process_index
+import reachability
+from test_expansion import random_graph, query_graph
+
+def offline_detect(graph, query, threshold):
+    graph = nx.DiGraph(graph)
+    with contextlib.redirect_stdout(io.StringIO()):
+        candidate_alignments = poirot.find_candidate_node_alignments_with_custom_comparison(query, graph, main.compare)
+        if candidate_alignments.keys() != set(query.nodes):
+            return False, None, 0.0
+        return main.detect(graph, query, threshold, candidate_alignments)
+
+def check_indexes(graph, r):
+    fresh = nx.DiGraph(graph)
+    for reverse in (False, True):
+        updated = process_index.get_process_ancestor_index(graph, reverse)
+        rebuilt = process_index.get_process_ancestor_index(fresh, reverse)
+        for node in graph.nodes:
+            assert updated.ancestors(node) == rebuilt.ancestors(node)
+    nodes = list(graph.nodes)
+    for _ in range(100):
+        a, b = r.choice(nodes), r.choice(nodes)
+        assert reachability.reachable(graph, a, b) == nx.has_path(graph, a, b)
+
+def test_online_matches_offline():
+    r = random.Random(0)
+    query = query_graph()
+    for _ in range(12):
+        full = random_graph(r, r.randint(15, 40), r.randint(20, 60))
+        edges = list(full.edges)
+        r.shuffle(edges)
+        threshold = r.choice([1, 2, 3])
+        batch_size = r.choice([1, 3])
+        graph = nx.DiGraph()
+        start = len(edges) // 3
+        for u, v in edges[:start]:
+            graph.add_node(u, node=full.nodes[u]['node'])
+            graph.add_node(v, node=full.nodes[v]['node'])
+            graph.add_edge(u, v)
+        with contextlib.redirect_stdout(io.StringIO()):
+            detector = online.OnlineDetector(graph, query, threshold, main.compare)
+        for i in range(start, len(edges), batch_size):
+            batch = [(full.nodes[u]['node'], full.nodes[v]['node']) for u, v in edges[i:i + batch_size]]
+            with contextlib.redirect_stdout(io.StringIO()):
+                detector.add_edges(batch)
+            alerted, alignment, score = offline_detect(graph, query, threshold)
+            assert detector.alerted == alerted
+            assert detector.alignment == alignment
+            assert abs(detector.score - score) < 1e-9
+            check_indexes(graph, r)
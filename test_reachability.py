@@ -0,0 +1,42 @@
+# Compares reachability.ReachabilityIndex with nx.has_path on small random
+# graphs, also after edges were added to the graph. Run with python -m pytest.
+
+import random
+import networkx as nx
+import compact_graph
+import reachability
+from test_expansion import random_graph
+
+def check_all_pairs(index, graph):
+    for a in graph.nodes:
+        for b in graph.nodes:
+            assert index.reachable(a, b) == nx.has_path(graph, a, b), (a, b)
+
+def test_reachable_matches_has_path():
+    r = random.Random(0)
+    for _ in range(100):
+        graph = random_graph(r, r.randint(1, 30), r.randint(0, 60))
+        for traversals in (1, reachability.TRAVERSALS):
+            check_all_pairs(reachability.ReachabilityIndex(graph, traversals, seed=r.randrange(100)), graph)
+
+def test_reachable_on_compact_graph():
+    r = random.Random(1)
+    for _ in range(20):
+        graph = random_graph(r, r.randint(1, 30), r.randint(0, 60))
+        compact = compact_graph.from_networkx(graph)
+        expected = nx.DiGraph()
+        expected.add_nodes_from(range(len(compact)))
+        expected.add_edges_from((int(u), int(v)) for u, v in compact.edges())
+        check_all_pairs(reachability.ReachabilityIndex(compact), expected)
+
+def test_reachable_after_added_edges():
+    r = random.Random(2)
+    for _ in range(50):
+        graph = random_graph(r, r.randint(2, 25), r.randint(0, 40))
+        index = reachability.ReachabilityIndex(graph)
+        for _ in range(r.randint(1, 10)):
+            a, b = r.randrange(len(graph) + 3), r.randrange(len(graph) + 3)
+            nodes = [f"n{node}" for node in (a, b) if f"n{node}" not in graph]
+            graph.add_edge(f"n{a}", f"n{b}")
+            assert index.add_edges(nodes, [(f"n{a}", f"n{b}")])
+        check_all_pairs(index, graph)
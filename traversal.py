@@ -0,0 +1,127 @@
+# Iterative graph traversal primitives.
+# Nothing here recurses, so deep process chains cannot hit Python's recursion
+# limit, and nothing copies the graph: reverse and undirected traversals read
+# predecessors directly through neighbor functions. Depth-first orders are the
+# same as those of the equivalent recursive traversals.
+
+import itertools
+from collections import deque
+
+def neighbor_function(graph, direction="forward"):
+    '''
+    params: graph: networkx.DiGraph (or CompactGraph)
+            direction: "forward" (successors), "reverse" (predecessors)
+            or "undirected" (successors, then predecessors)
+    returns: a function mapping a node to an iterable of its neighbors
+    '''
+    if direction == "forward":
+        return graph.__getitem__
+    elif direction == "reverse":
+        return graph.predecessors
+    elif direction == "undirected":
+        def undirected_neighbors(node):
+            neighbors = dict.fromkeys(graph[node])
+            neighbors.update(dict.fromkeys(graph.predecessors(node)))
+            return neighbors
+        return undirected_neighbors
+    raise ValueError(f"Unknown traversal direction: {direction}")
+
+def dfs(graph, source, direction="forward", visited=None, max_depth=None, predicate=None):
+    '''
+    iterative depth-first search
+    params: graph: graph to traverse
+            source: start node
+            direction: see neighbor_function
+            visited: optional set of already visited nodes, updated in place
+            max_depth: nodes further than max_depth edges (along the DFS tree) are not visited
+            predicate: nodes for which predicate(node) is false are neither visited nor expanded
+    returns: the set of visited nodes
+    '''
+    if visited is None:
+        visited = set()
+    if source in visited or (predicate is not None and not predicate(source)):
+        return visited
+    visited.add(source)
+    if source not in graph or max_depth == 0:
+        return visited
+    neighbors = neighbor_function(graph, direction)
+    stack = [(iter(neighbors(source)), 0)]
+    while stack:
+        remaining, depth = stack[-1]
+        for neighbor in remaining:
+            if neighbor in visited or (predicate is not None and not predicate(neighbor)):
+                continue
+            visited.add(neighbor)
+            if max_depth is None or depth + 1 < max_depth:
+                stack.append((iter(neighbors(neighbor)), depth + 1))
+                break
+        else:
+            stack.pop()
+    return visited
+
+def bfs(graph, source, direction="forward", max_depth=None, predicate=None):
+    '''
+    iterative breadth-first search
+    params: see dfs, max_depth bounds the shortest-path distance from source
+    returns: the list of visited nodes in visiting order
+    '''
+    if predicate is not None and not predicate(source):
+        return []
+    neighbors = neighbor_function(graph, direction)
+    visited = {source}
+    order = [source]
+    queue = deque([(source, 0)])
+    while queue:
+        node, depth = queue.popleft()
+        if max_depth is not None and depth >= max_depth:
+            continue
+        for neighbor in neighbors(node):
+            if neighbor not in visited and (predicate is None or predicate(neighbor)):
+                visited.add(neighbor)
+                order.append(neighbor)
+                queue.append((neighbor, depth + 1))
+    return order
+
+def simple_paths(graph, source, target, direction="forward", max_depth=None, path=None, steps=None):
+    '''
+    iteratively enumerates the simple paths from source to target
+    params: graph, direction: see dfs
+            source, target: endpoints
+            max_depth: optional maximum number of edges of a path
+            path: optional prefix already walked to reach source, its nodes are not revisited
+            steps: optional temporal.neighbor_function for direction, restricting
+            the edges paths may use
+    returns: generator of paths (lists of nodes, prefix included)
+    '''
+    path = list(path or []) + [source]
+    if source == target:
+        yield path
+        return
+    if source not in graph:
+        return
+    if steps is None:
+        neighbors = neighbor_function(graph, direction)
+        steps = lambda node, bound: zip(neighbors(node), itertools.repeat(None))
+    on_path = set(path)
+    base_length = len(path)
+    stack = [iter(steps(source, None))]
+    while stack:
+        for neighbor, bound in stack[-1]:
+            if neighbor in on_path:
+                continue
+            edges = len(path) - base_length + 1
+            if max_depth is not None and edges > max_depth:
+                continue
+            if neighbor == target:
+                yield path + [neighbor]
+                continue
+            if max_depth is not None and edges == max_depth:
+                continue
+            path.append(neighbor)
+            on_path.add(neighbor)
+            stack.append(iter(steps(neighbor, bound)))
+            break
+        else:
+            stack.pop()
+            if stack:
+                on_path.discard(path.pop())